@@ -0,0 +1,4 @@
+"""Performance benchmarks of Kaleidoscope.
+
+Run with ``python -m benchmarks --help``.
+"""
@@ -0,0 +1,138 @@
+"""Benchmark stages of the gallery build on a synthetic gallery.
+
+Results are printed as JSON, so they can be stored and compared across
+releases.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.synth import GalleryShape, create_gallery
+from kaleidoscope import generator, reader
+from kaleidoscope.backends import get_backend
+from kaleidoscope.config import BuildConfig
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    shape = GalleryShape(args.albums, args.photos, args.size, args.sections,
+                         args.captions)
+    config = BuildConfig(jobs=args.jobs, resize_backend=args.backend)
+    workdir = tempfile.mkdtemp(prefix='kaleidoscope-bench-')
+    try:
+        gallery_path = os.path.join(workdir, 'gallery')
+        create_gallery(gallery_path, shape)
+        results = run(gallery_path, workdir, config)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir)
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'shape': {
+            'albums': shape.albums,
+            'photos': shape.photos,
+            'size': list(shape.size),
+            'sections': shape.sections,
+            'captions': shape.captions,
+        },
+        'config': {'jobs': config.jobs, 'backend': config.resize_backend},
+        'results': results,
+    }
+    output = open(args.output, 'w') if args.output else sys.stdout
+    with output:
+        json.dump(report, output, indent=2)
+        output.write("\n")
+
+
+def run(gallery_path, workdir, config):
+    """Run all benchmarks on the gallery; return durations in seconds."""
+    results = {}
+    cache = reader.AlbumCache.load(os.path.join(workdir, 'albums'))
+    results['read_gallery_cold'] = _timed(reader.read_gallery, gallery_path)
+    reader.read_gallery(gallery_path, cache)
+    cache = reader.AlbumCache.load(cache.path)
+    results['read_gallery_warm'] = _timed(reader.read_gallery, gallery_path,
+                                          cache)
+
+    gallery = reader.read_gallery(gallery_path)
+    stages_output = os.path.join(workdir, 'stages')
+    results['resize'] = _timed(_resize_all, gallery, stages_output, config)
+    results['resized_metadata'] = _timed(_read_metadata, gallery,
+                                         stages_output)
+    results['render'] = _timed(_render_all, gallery, stages_output)
+
+    build_output = os.path.join(workdir, 'output')
+    for name in ('build_cold', 'build_warm'):
+        gallery = reader.read_gallery(gallery_path)
+        results[name] = _timed(generator.generate, gallery, build_output,
+                               generator.DefaultListener(), config)
+    return results
+
+
+def _resize_all(gallery, output, config):
+    backend = get_backend(config.resize_backend)
+    photos = [(photo, os.path.join(output, album.name))
+              for album in gallery.albums for photo in album.photos]
+    with ThreadPoolExecutor(config.jobs or os.cpu_count()) as pool:
+        list(pool.map(lambda p: generator.resize(p[0], p[1], backend),
+                      photos))
+
+
+def _read_metadata(gallery, output):
+    for album in gallery.albums:
+        album_output = os.path.join(output, album.name)
+        for photo in album.photos:
+            photo.thumb = generator.read_resized_metadata(
+                photo, 'thumb', album_output)
+            photo.large = generator.read_resized_metadata(
+                photo, 'large', album_output)
+
+
+def _render_all(gallery, output):
+    generator.generate_gallery_index(gallery, output)
+    for album in gallery.albums:
+        generator.generate_album_index(gallery, album,
+                                       os.path.join(output, album.name))
+
+
+def _timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def _parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks',
+                                     description=__doc__)
+    parser.add_argument('--albums', type=int, default=10)
+    parser.add_argument('--photos', type=int, default=20,
+                        help="number of photos in each album")
+    parser.add_argument('--size', type=_size, default=(3000, 2000),
+                        help="size of photos, e.g. 3000x2000")
+    parser.add_argument('--sections', type=int, default=1,
+                        help="number of sections in each album")
+    parser.add_argument('--captions', type=float, default=0.5,
+                        help="fraction of photos with caption")
+    parser.add_argument('--backend', default='pillow')
+    parser.add_argument('--jobs', type=int)
+    parser.add_argument('--output', help="write results to the file")
+    parser.add_argument('--keep', action='store_true',
+                        help="keep the generated gallery and output")
+    return parser.parse_args(argv)
+
+
+def _size(value):
+    width, _, height = value.partition('x')
+    return int(width), int(height)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""Generator of synthetic galleries for benchmarks."""
+import os
+import random
+from dataclasses import dataclass
+from datetime import date, timedelta
+
+WORDS = ("sunset beach mountain forest city river bridge tower garden lake "
+         "street market castle harbour morning evening winter summer").split()
+
+
+@dataclass
+class GalleryShape:
+    """
+    Shape of a synthetic gallery
+    - albums -- number of albums
+    - photos -- number of photos in each album
+    - size -- width and height of photos
+    - sections -- number of sections in each album
+    - captions -- fraction of photos with a caption
+    """
+    albums: int = 10
+    photos: int = 20
+    size: tuple = (3000, 2000)
+    sections: int = 1
+    captions: float = 0.5
+
+
+def create_gallery(path, shape, seed=0):
+    """Create gallery source directory with generated photos and configs."""
+    from PIL import Image
+
+    rnd = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, 'gallery.ini'), 'w') as f:
+        f.write("[gallery]\ntitle: Benchmark\nauthor: Benchmark\n")
+    # Photos are copies of a few distinct images, so creating the gallery
+    # does not dominate the benchmark run
+    templates = [_random_image(Image, shape.size, rnd) for _ in range(4)]
+    first_date = date(2000, 1, 1)
+    for a in range(shape.albums):
+        album_path = os.path.join(path, "album-%05d" % (a,))
+        os.makedirs(album_path, exist_ok=True)
+        names = ["IMG_%05d.jpg" % (p,) for p in range(shape.photos)]
+        for i, name in enumerate(names):
+            templates[i % len(templates)].save(os.path.join(album_path, name),
+                                               quality=90)
+        album_date = first_date + timedelta(days=rnd.randrange(365 * 20))
+        with open(os.path.join(album_path, 'album.ini'), 'w') as f:
+            f.write("[album]\ntitle: Album {}\ndate: {}\n".format(
+                a, album_date.isoformat()))
+            per_section = -(-len(names) // shape.sections)
+            for s in range(shape.sections):
+                f.write("\n[{}]\n".format(
+                    'photos' if s == 0 else "Section %d" % (s,)))
+                for name in names[s * per_section:(s + 1) * per_section]:
+                    f.write(_photo_line(name, shape.captions, rnd))
+
+
+def _photo_line(name, captions, rnd):
+    if rnd.random() >= captions:
+        return name + "\n"
+    caption = " ".join(rnd.choice(WORDS) for _ in range(rnd.randint(2, 6)))
+    return "{}: {}\n".format(name, caption.capitalize())
+
+
+def _random_image(Image, size, rnd):
+    """Smooth random gradient with some noise, similar to a photo."""
+    small = Image.new('RGB', (8, 6))
+    small.putdata([tuple(rnd.randrange(256) for _ in range(3))
+                   for _ in range(8 * 6)])
+    image = small.resize(size, Image.BICUBIC)
+    noise = Image.effect_noise(size, 24).convert('RGB')
+    return Image.blend(image, noise, 0.15)
@@ -17,28 +17,41 @@ function targetRowHeight(containerWidth) {
 
 function init() {
     const allThumbnails = [];
+    const layouts = {};
     const sections = document.querySelectorAll('.album');
     for (const section of sections) {
         const layout = new Layout(section);
+        layouts[section.dataset.section] = layout;
         allThumbnails.push(...layout.thumbnails);
     }
     photoswipe.init(allThumbnails);
+    const more = document.querySelector('.album-more');
+    if (more !== null) {
+        new ChunkLoader(more, layouts, allThumbnails.length);
+    }
 }
 
 class Layout {
     constructor(section) {
         this.root = section;
-        this.thumbnails = section.querySelectorAll('.thumbnail');
-        this.imagesInfo = this.collectInfo();
-        this.createCaptions();
-        this.doLayout();
+        this.thumbnails = [];
+        this.update();
         window.addEventListener('resize', () => this.doLayout())
 
     }
 
+    // Lay out thumbnails again after new ones were appended
+    update() {
+        const count = this.thumbnails.length;
+        this.thumbnails = this.root.querySelectorAll('.thumbnail');
+        this.imagesInfo = this.collectInfo();
+        this.createCaptions(count);
+        this.doLayout();
+    }
+
     collectInfo() {
         return Array.prototype.map.call(this.thumbnails, function(thumbnail) {
-            const img = thumbnail.firstElementChild;
+            const img = thumbnail.querySelector('img');
             return {
                 width: img.getAttribute('width'),
                 height: img.getAttribute('height')
@@ -46,12 +59,12 @@ class Layout {
         })
     }
 
-    createCaptions() {
-        for (let i = 0; i < this.thumbnails.length; i++) {
-            const image = this.thumbnails[i].firstElementChild;
+    createCaptions(start) {
+        for (let i = start; i < this.thumbnails.length; i++) {
+            const image = this.thumbnails[i].querySelector('img');
             const text = image.getAttribute('alt');
             if (text !== '') {
-                image.insertAdjacentHTML('afterend',
+                this.thumbnails[i].insertAdjacentHTML('beforeend',
                     '<div class="thumbnail__caption">' + text + '</div>')
             }
         }
@@ -83,7 +96,7 @@ class Layout {
         }
         for (var j = 0; j < geometry.boxes.length; j++) {
             var anchor = this.thumbnails[j];
-            var image = this.thumbnails[j].firstElementChild;
+            var image = this.thumbnails[j].querySelector('img');
             var box = geometry.boxes[j];
             this.setPosition(anchor, box, container);
             this.setSize(anchor, box);
@@ -94,6 +107,142 @@ class Layout {
 
 }
 
+/*
+ * Loads photos not included in the album page from its JSON photo list,
+ * one chunk each time the end of the page is close to becoming visible.
+ */
+class ChunkLoader {
+    constructor(sentinel, layouts, loaded) {
+        this.sentinel = sentinel;
+        this.layouts = layouts;
+        this.loaded = loaded;
+        this.chunkSize = parseInt(sentinel.dataset.chunkSize, 10);
+        this.photos = null;
+        this.loading = false;
+        this.observer = new IntersectionObserver(entries => {
+            if (entries.some(entry => entry.isIntersecting))
+                this.loadChunk();
+        }, {rootMargin: '1000px 0px'});
+        this.observer.observe(sentinel);
+    }
+
+    loadChunk() {
+        if (this.loading)
+            return;
+        this.loading = true;
+        this.fetchPhotos().then(photos => {
+            const chunk = photos.slice(this.loaded, this.loaded + this.chunkSize);
+            this.loaded += chunk.length;
+            this.append(chunk);
+            this.loading = false;
+            this.observer.unobserve(this.sentinel);
+            if (this.loaded < photos.length) {
+                // Observing again reports whether the end is still visible
+                this.observer.observe(this.sentinel);
+            } else {
+                this.sentinel.remove();
+            }
+        }).catch(error => {
+            // Try again when the sentinel becomes visible next time
+            console.error('Loading photos failed:', error);
+            this.photos = null;
+            this.loading = false;
+        });
+    }
+
+    fetchPhotos() {
+        if (this.photos === null) {
+            this.photos = fetch(this.sentinel.dataset.photos)
+                .then(response => {
+                    if (!response.ok)
+                        throw new Error(response.status + ' ' + response.statusText);
+                    return response.json();
+                })
+                .then(data => {
+                    const photos = [];
+                    data.sections.forEach((section, index) => {
+                        for (const photo of section.photos)
+                            photos.push({section, index, photo});
+                    });
+                    return photos;
+                });
+        }
+        return this.photos;
+    }
+
+    append(chunk) {
+        const thumbnails = [];
+        const changed = new Set();
+        for (const {section, index, photo} of chunk) {
+            const layout = this.layoutOf(section, index);
+            const thumbnail = createThumbnail(photo);
+            layout.root.appendChild(thumbnail);
+            thumbnails.push(thumbnail);
+            changed.add(layout);
+        }
+        for (const layout of changed)
+            layout.update();
+        photoswipe.add(thumbnails);
+    }
+
+    layoutOf(section, index) {
+        if (!(index in this.layouts)) {
+            if (!section.default) {
+                const title = document.createElement('h2');
+                title.className = 'section-title';
+                title.textContent = section.name;
+                this.sentinel.before(title);
+            }
+            const root = document.createElement('div');
+            root.className = 'album';
+            root.dataset.section = index;
+            this.sentinel.before(root);
+            this.layouts[index] = new Layout(root);
+        }
+        return this.layouts[index];
+    }
+}
+
+// Create the same thumbnail element as the album template
+function createThumbnail(photo) {
+    const [width, height] = photo.thumb.size;
+    const sizes = Math.round(220 * width / height) + 'px';
+    const anchor = document.createElement('a');
+    anchor.className = 'thumbnail';
+    anchor.href = photo.large.url;
+    anchor.dataset.largeSrcset = photo.large.srcset;
+    for (const [type, srcset] of photo.large.sources) {
+        const format = type.split('/')[1];
+        anchor.dataset['largeSrcset' + format.charAt(0).toUpperCase() +
+            format.slice(1)] = srcset;
+    }
+    const picture = document.createElement('picture');
+    for (const [type, srcset] of photo.thumb.sources) {
+        const source = document.createElement('source');
+        source.type = type;
+        source.srcset = srcset;
+        source.sizes = sizes;
+        picture.appendChild(source);
+    }
+    const img = document.createElement('img');
+    img.className = 'thumbnail__image';
+    img.loading = 'lazy';
+    if (photo.placeholder)
+        img.style.backgroundColor = photo.placeholder;
+    img.src = photo.thumb.url;
+    img.srcset = photo.thumb.srcset;
+    img.sizes = sizes;
+    img.alt = photo.caption;
+    img.dataset.description = photo.description;
+    img.setAttribute('width', width);
+    img.setAttribute('height', height);
+    img.dataset.fullWidth = photo.large.size[0];
+    img.dataset.fullHeight = photo.large.size[1];
+    picture.appendChild(img);
+    anchor.appendChild(picture);
+    return anchor;
+}
+
 function inPx(number) {
         return number.toString() + 'px';
     }
@@ -2,20 +2,32 @@ import PhotoSwipe from "photoswipe/dist/photoswipe";
 import PhotoSwipeUI_Default from "photoswipe/dist/photoswipe-ui-default";
 
 export default {
-    init: init
+    init: init,
+    add: add
 };
 
+// All thumbnails of the page and their gallery items, in the same order
+var allThumbnails = [];
+var allItems = [];
+
 function init(thumbnails) {
-    var items = collectItems(thumbnails);
+    add(thumbnails);
+}
+
+// Add thumbnails appended to the page
+function add(thumbnails) {
+    var start = allThumbnails.length;
+    Array.prototype.push.apply(allThumbnails, thumbnails);
+    Array.prototype.push.apply(allItems, collectItems(thumbnails));
     var pswp = document.querySelector('.pswp');
-    for (var i = 0; i < thumbnails.length; i++) {
-        bind(thumbnails, i, items, pswp);
+    for (var i = start; i < allThumbnails.length; i++) {
+        bind(allThumbnails, i, allItems, pswp);
     }
 }
 
 function collectItems(thumbnails) {
     return Array.prototype.map.call(thumbnails, function(thumbnail) {
-        var img = thumbnail.firstElementChild;
+        var img = thumbnail.querySelector('img');
         return {
             src: thumbnail.getAttribute('href'),
             msrc: img.getAttribute('src'),
@@ -29,6 +41,7 @@ function collectItems(thumbnails) {
 function bind(thumbnails, i, items, pswp) {
     thumbnails[i].addEventListener('click', function (event) {
         event.preventDefault();
+        chooseLargeImages(thumbnails[i], thumbnails, items);
         var options = {
             index: i,
             bgOpacity: 0.85,
@@ -43,3 +56,44 @@ function bind(thumbnails, i, items, pswp) {
         new PhotoSwipe(pswp, PhotoSwipeUI_Default, items, options).init();
     })
 }
+
+// Show large images in the same format the browser picked for thumbnails,
+// in the smallest resolution covering the screen
+function chooseLargeImages(thumbnail, thumbnails, items) {
+    var source = thumbnail.querySelector('img').currentSrc.split('?')[0];
+    var format = source.slice(source.lastIndexOf('.') + 1);
+    var key = 'largeSrcset' + format.charAt(0).toUpperCase() + format.slice(1);
+    for (var i = 0; i < thumbnails.length; i++) {
+        var img = thumbnails[i].querySelector('img');
+        var srcset = thumbnails[i].dataset[key] ||
+            thumbnails[i].dataset.largeSrcset;
+        var ratio = img.dataset.fullWidth / img.dataset.fullHeight;
+        var candidate = chooseCandidate(parseSrcset(srcset), ratio);
+        if (candidate) {
+            items[i].src = candidate.url;
+            items[i].w = candidate.width;
+            items[i].h = Math.round(candidate.width / ratio);
+        }
+        items[i].msrc = img.currentSrc || img.getAttribute('src');
+    }
+}
+
+function parseSrcset(srcset) {
+    if (!srcset)
+        return [];
+    return srcset.split(', ').map(function (candidate) {
+        var parts = candidate.split(' ');
+        return {url: parts[0], width: parseInt(parts[1], 10)};
+    });
+}
+
+function chooseCandidate(candidates, ratio) {
+    // Width of the image fitted to the screen
+    var screenWidth = Math.min(window.innerWidth, window.innerHeight * ratio);
+    var needed = screenWidth * (window.devicePixelRatio || 1);
+    for (var i = 0; i < candidates.length; i++) {
+        if (candidates[i].width >= needed)
+            return candidates[i];
+    }
+    return candidates[candidates.length - 1];
+}
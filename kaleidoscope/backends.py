@@ -0,0 +1,212 @@
+"""Image resizing backends.
+
+A backend takes a source image and a list of outputs ordered from the
+largest to the smallest. Each output is a pair of geometry (maximal width
+and height) and a list of target paths. Format of each target is determined
+by its extension, so the same image can be written in several formats. An
+output without targets is only computed as an intermediate step. The source
+is decoded once and each output is resized from the previous one.
+
+`resize` returns sizes of written outputs in the order of outputs, or None
+for sizes the backend does not know without reading the written file. If
+size of the source is known, it can be passed as `source_size`.
+
+`supported_formats` returns names of additional formats ('webp', 'avif')
+the backend can write.
+
+`placeholder` returns the average colour of an image (usually a small
+thumbnail) as a CSS hex colour. When called with `placeholder=True`,
+`resize` computes it from the smallest written output while it is still in
+memory and returns a pair of sizes and the colour (or None if nothing was
+written).
+"""
+import subprocess
+
+# Colour channels of an image resized to a single pixel
+PLACEHOLDER_FORMAT = '%[fx:int(255*r)],%[fx:int(255*g)],%[fx:int(255*b)]'
+
+
+class ConvertBackend:
+    """Resizes images by running ImageMagick ``convert``."""
+    name = 'convert'
+    version = '1'
+
+    def __init__(self):
+        self._formats = None
+
+    def resize(self, source, outputs, source_size=None, placeholder=False):
+        command = ['convert', source, '-auto-orient']
+        factor = shrink_factor(source, source_size, outputs[0][0])
+        if factor > 1:
+            # Let the JPEG decoder produce a smaller image directly
+            width, height = source_size
+            command[1:1] = ['-define', 'jpeg:size={}x{}'.format(
+                width // factor, height // factor)]
+        last_write = None
+        for geometry, targets in outputs:
+            command += ['-resize', "{}x{}>".format(*geometry)]
+            for target in targets:
+                command += ['-write', target]
+                last_write = len(command) - 2
+        sizes = [None for geometry, targets in outputs if targets]
+        colour = None
+        if last_write is not None:
+            # The last written image is the regular output, not a '-write'
+            target = command[last_write + 1]
+            del command[last_write:]
+            if placeholder:
+                # Print the colour of a 1x1 copy of the smallest output
+                command += ['(', '+clone', '-resize', '1x1!',
+                            '-format', PLACEHOLDER_FORMAT, '-write', 'info:',
+                            '+delete', ')', target]
+                result = subprocess.run(command, stdout=subprocess.PIPE,
+                                        universal_newlines=True)
+                if result.returncode == 0:
+                    colour = _parse_colour(result.stdout)
+            else:
+                subprocess.run(command + [target])
+        return (sizes, colour) if placeholder else sizes
+
+    def supported_formats(self):
+        if self._formats is None:
+            result = subprocess.run(['convert', '-list', 'format'],
+                                    stdout=subprocess.PIPE,
+                                    universal_newlines=True)
+            self._formats = set()
+            for line in result.stdout.splitlines():
+                fields = line.split()
+                # Format name (with '*' for native blob support) and mode
+                if len(fields) >= 3 and 'w' in fields[2]:
+                    self._formats.add(fields[0].rstrip('*').lower())
+        return {'webp', 'avif'} & self._formats
+
+    def placeholder(self, path):
+        result = subprocess.run(
+            ['convert', path, '-resize', '1x1!', '-format',
+             PLACEHOLDER_FORMAT, 'info:'],
+            stdout=subprocess.PIPE, universal_newlines=True, check=True)
+        return _parse_colour(result.stdout)
+
+
+class PillowBackend:
+    """Resizes images in-process using Pillow.
+
+    JPEG sources are decoded in draft mode, so the decoder directly produces
+    a downscaled image when the source is much larger than the output.
+    """
+    name = 'pillow'
+    quality = 90
+
+    def __init__(self):
+        import PIL
+        self.version = '1-' + PIL.__version__
+
+    def resize(self, source, outputs, source_size=None, placeholder=False):
+        from PIL import Image, ImageOps
+
+        sizes = []
+        oriented = None
+        with Image.open(source) as image:
+            icc_profile = image.info.get('icc_profile')
+            transposed = image.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8)
+            for geometry, targets in outputs:
+                if transposed:
+                    geometry = (geometry[1], geometry[0])
+                # thumbnail() only shrinks and uses draft mode for JPEG
+                image.thumbnail(geometry, Image.LANCZOS, reducing_gap=2.0)
+                if targets:
+                    oriented = ImageOps.exif_transpose(image)
+                    for target in targets:
+                        self._save(oriented, target, icc_profile)
+                    sizes.append(oriented.size)
+            if placeholder:
+                colour = None if oriented is None \
+                    else _average_colour(oriented)
+                return sizes, colour
+        return sizes
+
+    def supported_formats(self):
+        from PIL import features
+        formats = set()
+        for name in ('webp', 'avif'):
+            try:
+                if features.check(name):
+                    formats.add(name)
+            except ValueError:
+                # Feature unknown to this version of Pillow
+                pass
+        return formats
+
+    def placeholder(self, path):
+        from PIL import Image
+
+        with Image.open(path) as image:
+            return _average_colour(image)
+
+    def _save(self, image, target, icc_profile):
+        params = {}
+        if icc_profile:
+            params['icc_profile'] = icc_profile
+        extension = target.lower().rpartition('.')[2]
+        if extension in ('jpg', 'jpeg'):
+            params['quality'] = self.quality
+            if image.mode not in ('RGB', 'L', 'CMYK'):
+                image = image.convert('RGB')
+        elif extension in ('webp', 'avif'):
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.mode else 'RGB')
+        image.save(target, **params)
+
+
+ORIENTATION_TAG = 0x0112
+
+
+def shrink_factor(source, source_size, geometry):
+    """Factor (1, 2, 4 or 8) by which JPEG decoder can shrink the source
+    while loading it, keeping at least twice the size of the largest output.
+
+    Pillow applies the same reduction in its draft mode.
+    """
+    if source_size is None or \
+            not source.lower().endswith(('.jpg', '.jpeg')):
+        return 1
+    width, height = source_size
+    factor = 1
+    while factor < 8 and width // (factor * 2) >= 2 * geometry[0] and \
+            height // (factor * 2) >= 2 * geometry[1]:
+        factor *= 2
+    return factor
+
+
+def _average_colour(image):
+    from PIL import Image
+
+    pixel = image.convert('RGB').resize((1, 1), Image.BOX)
+    return _hex_colour(pixel.getpixel((0, 0)))
+
+
+def _parse_colour(output):
+    return _hex_colour(int(n) for n in output.split(','))
+
+
+def _hex_colour(rgb):
+    return '#' + ''.join('{:02x}'.format(channel) for channel in rgb)
+
+
+BACKENDS = {
+    'convert': ConvertBackend,
+    'pillow': PillowBackend,
+}
+
+
+def get_backend(name):
+    """Create resizing backend by its name."""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError("Unknown resize backend: " + name) from None
+    try:
+        return backend_class()
+    except ImportError:
+        raise ValueError("Resize backend '{}' is not available, required "
+                         "library is not installed".format(name)) from None
@@ -1,3 +1,4 @@
+import dataclasses
 import locale
 import os
 from pathlib import Path
@@ -5,9 +6,16 @@ from pathlib import Path
 import click
 from tqdm import tqdm  # type: ignore
 
-from kaleidoscope.gallery import generate_gallery_ini, generate_album_ini
-from kaleidoscope.generator import generate, DefaultListener
-from kaleidoscope.reader import read_gallery
+from kaleidoscope import watcher
+from kaleidoscope.backends import BACKENDS, get_backend
+from kaleidoscope.compress import get_compressors
+from kaleidoscope.gallery import generate_gallery_ini, init_albums
+from kaleidoscope.generator import generate, DefaultListener, \
+    ListenerGroup, Stopwatch, Generator
+from kaleidoscope.profiler import Profiler
+from kaleidoscope.reader import read_gallery, read_build_config, \
+    AlbumCache, ALBUM_CACHE_NAME
+from kaleidoscope.shard import Shard
 
 gallery_path = "."
 
@@ -22,12 +30,90 @@ def cli(ctx, gallery):
         gallery_path = gallery
 
 
+def build_options(command):
+    """Add options overriding the gallery build config to the command."""
+    options = [
+        click.option('--jobs', '-j', type=click.IntRange(min=1),
+                     help="Number of photos resized in parallel "
+                          "[default: number of CPUs]."),
+        click.option('--backend', 'resize_backend',
+                     type=click.Choice(sorted(BACKENDS)),
+                     help="Resize backend [default: convert]."),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def _parse_shard(ctx, param, value):
+    if value is None:
+        return None
+    try:
+        return Shard.parse(value)
+    except ValueError as e:
+        raise click.BadParameter(str(e))
+
+
 @cli.command()
-def build():
+@build_options
+@click.option('--profile', type=click.Path(dir_okay=False, writable=True),
+              help="Write durations of build stages as JSON into the file.")
+@click.option('--shard', metavar='I/N', callback=_parse_shard,
+              help="Build only I-th of N parts of albums, "
+                   "to be combined by the merge command.")
+@click.option('--output', type=click.Path(file_okay=False),
+              help="Output directory [default: output in the gallery].")
+def build(profile, shard, output, **options):
     """Build gallery."""
-    gallery = read_gallery(gallery_path)
+    config = _build_config(**options)
+    output_path = output or os.path.join(gallery_path, "output")
+    listener = ProgressReporter()
+    profiler = None
+    if profile is not None:
+        profiler = Profiler()
+        listener = ListenerGroup(listener, profiler)
+    stopwatch = Stopwatch()
+    cache = AlbumCache.load(os.path.join(output_path, ALBUM_CACHE_NAME))
+    gallery = read_gallery(gallery_path, cache)
+    listener.stage_finished('read', None, *stopwatch.elapsed())
+    generate(gallery, output_path, listener, config, shard)
+    if profiler is not None:
+        profiler.write(profile)
+
+
+@cli.command()
+@build_options
+@click.argument('shard_outputs', nargs=-1,
+                type=click.Path(exists=True, file_okay=False))
+def merge(shard_outputs, **options):
+    """Combine shards and generate gallery index.
+
+    Shards built into the gallery output are merged automatically, shards
+    built into other directories are moved from SHARD_OUTPUTS.
+    """
+    config = _build_config(**options)
+    output_path = os.path.join(gallery_path, "output")
+    cache = AlbumCache.load(os.path.join(output_path, ALBUM_CACHE_NAME))
+    gallery = read_gallery(gallery_path, cache)
+    Generator(output_path, ProgressReporter(), config).merge(gallery,
+                                                             shard_outputs)
+
+
+@cli.command()
+@build_options
+@click.option('--interval', type=click.FloatRange(min=0.1), default=1.0,
+              show_default=True,
+              help="Seconds between checks for changes.")
+def watch(interval, **options):
+    """Build gallery and rebuild albums when they change."""
+    config = _build_config(**options)
     output_path = os.path.join(gallery_path, "output")
-    generate(gallery, output_path, ProgressReporter())
+    print("Watching for changes, press Ctrl+C to stop")
+    try:
+        watcher.watch(gallery_path, output_path, ProgressReporter(), config,
+                      interval)
+    except KeyboardInterrupt:
+        pass
 
 
 @cli.command(name='init-gallery')
@@ -37,30 +123,67 @@ def init_gallery():
 
 
 @cli.command(name='init-album')
-@click.argument('directory',
+@click.argument('directories', nargs=-1,
                 type=click.Path(exists=True, file_okay=False, dir_okay=True))
-def init_album(directory):
-    """Generate album configuration file with list of photos."""
-    generate_album_ini(Path(gallery_path).joinpath(directory))
+@click.option('--all', 'all_albums', is_flag=True,
+              help="Initialize all directories of the gallery with photos.")
+@click.option('--jobs', '-j', type=click.IntRange(min=1),
+              help="Number of directories scanned in parallel.")
+def init_album(directories, all_albums, jobs):
+    """Generate album configuration files with list of photos.
+
+    Photos added to a directory with existing configuration file are
+    appended to it. Directories not changed since the previous run are
+    skipped.
+    """
+    if all_albums == bool(directories):
+        raise click.UsageError("Specify album directories or --all.")
+    paths = None
+    if not all_albums:
+        paths = [os.path.join(gallery_path, d) for d in directories]
+    for path, result in init_albums(gallery_path, paths, jobs):
+        if result is not None:
+            print(os.path.join(path, 'album.ini') + " " + result)
+
+
+def _build_config(**options):
+    """Read build config of the gallery, overridden by command options."""
+    try:
+        config = read_build_config(gallery_path)
+        overrides = {k: v for k, v in options.items() if v is not None}
+        config = dataclasses.replace(config, **overrides)
+        get_backend(config.resize_backend)
+        get_compressors(config.compress)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    return config
 
 
 class ProgressReporter(DefaultListener):
-    """Reports progress of gallery generation to a user."""
+    """Reports progress of gallery generation to a user.
+
+    Albums are processed concurrently, so a single progress bar shows
+    resizing of photos from all albums being processed.
+    """
     def __init__(self):
         self._progressbar = None
 
     def starting_album(self, album, photos_to_process):
-        print("Generating album " + album.title)
         if photos_to_process > 0:
-            self._progressbar = tqdm(desc="Resizing", unit="photo",
-                                     total=photos_to_process)
+            if self._progressbar is None:
+                self._progressbar = tqdm(desc="Resizing", unit="photo",
+                                         total=0)
+            self._progressbar.total += photos_to_process
+            self._progressbar.refresh()
 
     def resizing_photo(self, photo):
         self._progressbar.update(1)
 
-    def finishing_album(self):
-        if self._progressbar:
-            self._progressbar.close()
+    def finishing_album(self, album):
+        tqdm.write("Generated album " + album.title)
+        bar = self._progressbar
+        if bar is not None and bar.n == bar.total:
+            bar.close()
             self._progressbar = None
 
 
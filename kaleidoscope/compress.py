@@ -0,0 +1,128 @@
+"""Precompression of text output files.
+
+Compressed copies are written next to the original files with `.gz` and
+`.br` suffixes, so web servers can serve them without compressing each
+response (e.g. nginx `gzip_static` and `brotli_static`). Modification time of
+each compressed copy is set to the modification time of the original, so
+only changed files are compressed again. Written copies are returned to the
+caller, so they can be removed when they are no longer wanted; other
+compressed files in the output are never removed.
+"""
+import gzip
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+TEXT_EXTENSIONS = ('.html', '.css', '.js', '.json', '.svg', '.xml', '.txt')
+SUFFIXES = {'gzip': '.gz', 'brotli': '.br'}
+# The only directory in the output with text files in subdirectories
+ASSETS_DIR = 'assets'
+
+
+def gzip_compress(data):
+    # Without a timestamp, so the same content gives the same file
+    buffer = io.BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', fileobj=buffer,
+                       compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buffer.getvalue()
+
+
+def brotli_compress(data):
+    import brotli  # type: ignore
+    return brotli.compress(data, quality=11)
+
+
+COMPRESSORS = {
+    'gzip': gzip_compress,
+    'brotli': brotli_compress,
+}
+
+
+def get_compressors(methods):
+    """Get compression functions by file suffix for given method names."""
+    compressors = {}
+    for method in methods:
+        if method not in COMPRESSORS:
+            raise ValueError("Unknown compression: " + method)
+        if method == 'brotli':
+            try:
+                import brotli  # type: ignore # noqa: F401
+            except ImportError:
+                raise ValueError("Compression 'brotli' is not available, "
+                                 "required library is not installed") \
+                    from None
+        compressors[SUFFIXES[method]] = COMPRESSORS[method]
+    return compressors
+
+
+def compressed_original(name):
+    """Name of the original file if the name is of its compressed copy."""
+    base, suffix = os.path.splitext(name)
+    if suffix in SUFFIXES.values() and base.endswith(TEXT_EXTENSIONS):
+        return base
+    return None
+
+
+def compress_output(output, compressors, jobs=None, previous=()):
+    """Write compressed copies of changed pages and assets in the output
+    directory.
+
+    Text files are searched in the output, album directories and the assets
+    directory, without directories of resized images and hidden directories.
+    Compressed copies in `previous` (as returned by the previous call) are
+    deleted if their original was removed or their method is not in
+    `compressors`. Files are compressed in parallel by `jobs` threads.
+
+    Returns paths of compressed copies in the output, relative to it, and
+    the number of written compressed files.
+    """
+    copies = set()
+    tasks = []
+    if compressors:
+        for path in _text_files(output):
+            for suffix, compress in compressors.items():
+                copies.add(os.path.relpath(path + suffix, output))
+                if _is_outdated(path, path + suffix):
+                    tasks.append((path, suffix, compress))
+    for relative_path in set(previous) - copies:
+        try:
+            os.remove(os.path.join(output, relative_path))
+        except FileNotFoundError:
+            pass
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(lambda task: compress_file(*task), tasks))
+    return copies, len(tasks)
+
+
+def _text_files(output):
+    for directory, dirs, files in os.walk(output):
+        relative = os.path.relpath(directory, output)
+        if relative == os.curdir:
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+        elif relative.split(os.sep)[0] != ASSETS_DIR:
+            # Subdirectories of albums contain only resized images
+            dirs[:] = []
+        for name in files:
+            if name.endswith(TEXT_EXTENSIONS):
+                yield os.path.join(directory, name)
+
+
+def compress_file(path, suffix, compress):
+    """Write compressed copy of the file with given suffix."""
+    stat = os.stat(path)
+    with open(path, 'rb') as f:
+        data = compress(f.read())
+    target = path + suffix
+    with open(target + '.tmp', 'wb') as f:
+        f.write(data)
+    os.utime(target + '.tmp', ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    os.replace(target + '.tmp', target)
+
+
+def _is_outdated(path, compressed_path):
+    try:
+        compressed_mtime = os.stat(compressed_path).st_mtime_ns
+    except FileNotFoundError:
+        return True
+    return compressed_mtime != os.stat(path).st_mtime_ns
@@ -1,4 +1,6 @@
 from configparser import ConfigParser
+from dataclasses import dataclass
+from typing import Optional, Tuple
 
 
 class GalleryConfigParser(ConfigParser):
@@ -12,3 +14,51 @@ class GalleryConfigParser(ConfigParser):
             return option
         else:
             return option.lower()
+
+
+@dataclass
+class BuildConfig:
+    """
+    Settings of the gallery build
+    - jobs -- number of photos resized in parallel, default is CPU count
+    - resize_backend -- name of the resize backend (see backends.BACKENDS)
+    - content_hash -- detect changed photos by content hash, not only by
+      size and modification time
+    - formats -- additional formats of resized images ('webp', 'avif')
+    - thumb_sizes, large_sizes -- ladders of maximal geometries (width and
+      height) of thumbnails and large images, the first one is the default
+      image
+    - compress -- methods of precompression of text files ('gzip',
+      'brotli')
+    - fingerprint -- add content hash of assets and resized images to their
+      URLs, so they can be cached forever
+    - year_pages -- list albums of each year on a separate page, the gallery
+      index lists only years
+    - album_covers -- show thumbnail of the first photo of each album in
+      gallery index pages
+    - chunk_size -- number of photos included in album pages, other photos
+      are loaded from a JSON file when needed; all by default
+    - placeholders -- compute average colour of each photo, shown before its
+      thumbnail is loaded
+    - pixel_budget -- maximal number of megapixels of source photos decoded
+      at once, unlimited by default
+    - dedupe -- resize photos into a content-addressed store linked into
+      album outputs, so photos included in several albums are resized once
+    - staging -- build in a staging copy of the output, which atomically
+      replaces the output when the build is finished
+    """
+    jobs: Optional[int] = None
+    resize_backend: str = 'convert'
+    content_hash: bool = False
+    formats: Tuple[str, ...] = ()
+    thumb_sizes: Tuple[Tuple[int, int], ...] = ((330, 220),)
+    large_sizes: Tuple[Tuple[int, int], ...] = ((1500, 1000),)
+    compress: Tuple[str, ...] = ()
+    fingerprint: bool = False
+    year_pages: bool = False
+    album_covers: bool = False
+    chunk_size: Optional[int] = None
+    placeholders: bool = False
+    pixel_budget: Optional[float] = None
+    dedupe: bool = False
+    staging: bool = False
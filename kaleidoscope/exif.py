@@ -0,0 +1,145 @@
+"""Reading of photo metadata from EXIF.
+
+Only the header of the source file is read, without decoding the image.
+EXIF tags and dimensions of JPEG files are parsed from their segments,
+dimensions of other files are read by `imagesize`.
+"""
+import datetime
+import struct
+
+import imagesize  # type: ignore
+
+from kaleidoscope.model import PhotoMetadata
+
+MAKE = 0x010F
+MODEL = 0x0110
+ORIENTATION = 0x0112
+DATE_TIME = 0x0132
+EXIF_IFD = 0x8769
+DATE_TIME_ORIGINAL = 0x9003
+TAGS = {MAKE, MODEL, ORIENTATION, DATE_TIME, EXIF_IFD, DATE_TIME_ORIGINAL}
+
+# Markers of JPEG segments with dimensions of the image
+START_OF_FRAME = set(range(0xc0, 0xd0)) - {0xc4, 0xc8, 0xcc}
+# Size and format of values by TIFF type (ASCII, SHORT, LONG)
+TYPES = {2: (1, None), 3: (2, 'H'), 4: (4, 'I')}
+
+
+def read_metadata(path) -> PhotoMetadata:
+    """Read capture time, camera, orientation and dimensions of the photo.
+
+    Dimensions are of the photo as displayed, i.e. after orientation.
+    """
+    tags, size = {}, None
+    if path.lower().endswith(('.jpg', '.jpeg')):
+        try:
+            tags, size = read_jpeg_header(path)
+        except (OSError, ValueError):
+            pass
+    else:
+        width, height = imagesize.get(path)
+        if width > 0 and height > 0:
+            size = (width, height)
+    orientation = tags.get(ORIENTATION) or 1
+    if size is not None and orientation in (5, 6, 7, 8):
+        size = (size[1], size[0])
+    taken = _parse_datetime(tags.get(DATE_TIME_ORIGINAL)) or \
+        _parse_datetime(tags.get(DATE_TIME))
+    return PhotoMetadata(taken, _camera(tags), orientation, size)
+
+
+def read_jpeg_header(path):
+    """Read tags used by `read_metadata` (by tag ID) and dimensions (or
+    None) from the JPEG file.
+
+    Raises ValueError if the EXIF segment is malformed.
+    """
+    tags = {}
+    with open(path, 'rb') as f:
+        if f.read(2) != b'\xff\xd8':
+            return tags, None
+        while True:
+            header = f.read(4)
+            if len(header) < 4 or header[0] != 0xff:
+                return tags, None
+            marker = header[1]
+            length = struct.unpack('>H', header[2:])[0]
+            if marker in START_OF_FRAME:
+                height, width = struct.unpack('>xHH', f.read(5))
+                return tags, (width, height)
+            if marker in (0xd9, 0xda):
+                # End of image or start of image data
+                return tags, None
+            data = f.read(length - 2)
+            if marker == 0xe1 and data.startswith(b'Exif\0\0'):
+                tags = _parse_tiff(data[6:])
+
+
+def metadata_to_json(metadata):
+    """Convert metadata into a JSON compatible dictionary."""
+    data = metadata._asdict()
+    if metadata.taken is not None:
+        data['taken'] = metadata.taken.isoformat()
+    return data
+
+
+def metadata_from_json(data):
+    taken = data['taken']
+    if taken is not None:
+        taken = datetime.datetime.fromisoformat(taken)
+    size = data['size']
+    return PhotoMetadata(taken, data['camera'], data['orientation'],
+                         tuple(size) if size is not None else None)
+
+
+def _parse_tiff(data):
+    try:
+        byte_order = {b'II': '<', b'MM': '>'}[data[:2]]
+        offset = struct.unpack(byte_order + 'I', data[4:8])[0]
+        tags = _read_ifd(data, byte_order, offset)
+        if tags.get(EXIF_IFD):
+            tags.update(_read_ifd(data, byte_order, tags[EXIF_IFD]))
+    except (KeyError, IndexError, TypeError, struct.error):
+        raise ValueError("Invalid EXIF data") from None
+    return tags
+
+
+def _read_ifd(data, byte_order, offset):
+    """Read wanted tags with supported types from the image file
+    directory."""
+    tags = {}
+    count = struct.unpack_from(byte_order + 'H', data, offset)[0]
+    for index in range(count):
+        tag, tag_type, value_count = struct.unpack_from(
+            byte_order + 'HHI', data, offset + 2 + 12 * index)
+        if tag not in TAGS or tag_type not in TYPES:
+            continue
+        value_offset = offset + 2 + 12 * index + 8
+        item_size, item_format = TYPES[tag_type]
+        if item_size * value_count > 4:
+            value_offset = struct.unpack_from(byte_order + 'I', data,
+                                              value_offset)[0]
+        if item_format is None:
+            value = data[value_offset:value_offset + value_count]
+            tags[tag] = value.split(b'\0', 1)[0].decode('utf-8', 'replace') \
+                .strip()
+        else:
+            tags[tag] = struct.unpack_from(byte_order + item_format, data,
+                                           value_offset)[0]
+    return tags
+
+
+def _parse_datetime(value):
+    try:
+        return datetime.datetime.strptime(value, '%Y:%m:%d %H:%M:%S')
+    except (TypeError, ValueError):
+        return None
+
+
+def _camera(tags):
+    make = tags.get(MAKE) or ''
+    model = tags.get(MODEL) or ''
+    if model.lower().startswith(make.lower()):
+        # Model usually includes the make, e.g. 'Canon EOS 5D'
+        return model or None
+    return ' '.join(filter(None, (make, model))) or None
@@ -1,7 +1,15 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import List, Optional
 
 from kaleidoscope import renderer
+from kaleidoscope.config import GalleryConfigParser
+
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.gif')
+INIT_STATE_NAME = '.kaleidoscope-init'
 
 
 def generate_gallery_ini(gallery_path: Path):
@@ -10,13 +18,21 @@ def generate_gallery_ini(gallery_path: Path):
     print("gallery.ini generated")
 
 
-def generate_album_ini(album_path: Path):
-    album_ini_path = album_path.joinpath('album.ini')
+def generate_album_ini(album_path: Path,
+                       photos: Optional[List[str]] = None) -> Optional[str]:
+    """Generate album configuration file listing photos of the directory.
 
-    image_suffixes = ['.jpg', '.jpeg', '.png', '.gif']
-    photos = [file.name for file in album_path.iterdir()
-              if file.suffix.lower() in image_suffixes]
-    photos.sort()
+    If the file exists, photos not listed in any of its sections are
+    appended to it, so existing captions, sections and comments are kept.
+    Returns 'generated', 'updated' or None if the file did not change.
+    """
+    album_ini_path = album_path.joinpath('album.ini')
+    if photos is None:
+        photos = find_photos(album_path)
+    if album_ini_path.exists():
+        if _add_photos(str(album_ini_path), photos):
+            return 'updated'
+        return None
 
     creation_time = datetime.fromtimestamp(album_path.stat().st_ctime)
     context = {
@@ -26,4 +42,103 @@ def generate_album_ini(album_path: Path):
     }
 
     renderer.render('album.ini', str(album_ini_path), context)
-    print(str(album_ini_path) + " generated")
+    return 'generated'
+
+
+def find_photos(album_path: Path) -> List[str]:
+    """Sorted names of photos in the directory."""
+    with os.scandir(str(album_path)) as entries:
+        photos = [entry.name for entry in entries
+                  if entry.name.lower().endswith(IMAGE_SUFFIXES)
+                  and entry.is_file()]
+    photos.sort()
+    return photos
+
+
+def _add_photos(album_ini_path, photos):
+    """Append photos not listed in the album config to its last photo
+    section, or to a new `[photos]` section if it has none. Returns True if
+    any photo was added."""
+    config = GalleryConfigParser()
+    config.read(album_ini_path)
+    photo_sections = [section for section in config.sections()
+                      if section != 'album']
+    listed = {name for section in photo_sections for name in config[section]}
+    added = [photo + '\n' for photo in photos if photo not in listed]
+    if not added:
+        return False
+    with open(album_ini_path) as f:
+        lines = f.readlines()
+    if lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    if photo_sections:
+        end = _section_end(lines, photo_sections[-1])
+        lines[end:end] = added
+    else:
+        lines += ['\n', '[photos]\n'] + added
+    renderer.write_if_changed(album_ini_path, ''.join(lines))
+    return True
+
+
+def _section_end(lines, name):
+    """Index of the line after the last non-empty line of the section."""
+    headers = [index for index, line in enumerate(lines)
+               if GalleryConfigParser.SECTCRE.match(line.rstrip())]
+    start = next(index for index in headers
+                 if lines[index].strip() == '[{}]'.format(name))
+    end = next((index for index in headers if index > start), len(lines))
+    while end > start + 1 and not lines[end - 1].strip():
+        end -= 1
+    return end
+
+
+def init_albums(gallery_path: str, album_paths: Optional[List[str]] = None,
+                jobs: Optional[int] = None):
+    """Generate or update album configuration files of given directories,
+    or of all directories of the gallery with photos (other directories are
+    skipped).
+
+    Directories are scanned in parallel by `jobs` threads. Modification
+    times of the directories are recorded in the gallery, so directories
+    without added or removed files since the previous run are skipped.
+    Returns pairs of album directory and result of generate_album_ini.
+    """
+    state_path = os.path.join(gallery_path, INIT_STATE_NAME)
+    state = _read_state(state_path)
+    scan_all = album_paths is None
+    if album_paths is None:
+        with os.scandir(gallery_path) as entries:
+            paths = sorted(entry.path for entry in entries
+                           if entry.is_dir()
+                           and not entry.name.startswith('.'))
+        # Forget removed directories
+        previous, state = state, {}
+    else:
+        paths = album_paths
+        previous = state
+
+    def init(path):
+        name = os.path.relpath(path, gallery_path)
+        if previous.get(name) == os.stat(path).st_mtime_ns:
+            return name, path, None
+        photos = find_photos(Path(path))
+        if scan_all and not photos and \
+                not os.path.exists(os.path.join(path, 'album.ini')):
+            return name, path, None
+        return name, path, generate_album_ini(Path(path), photos)
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(init, paths))
+    for name, path, _ in results:
+        # Writing the config changed modification time of the directory
+        state[name] = os.stat(path).st_mtime_ns
+    renderer.write_if_changed(state_path, json.dumps(state, sort_keys=True))
+    return [(path, result) for _, path, result in results]
+
+
+def _read_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
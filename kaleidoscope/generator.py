@@ -1,14 +1,53 @@
+import filecmp
+import json
 import os
+import re
 import shutil
-import subprocess
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import date
 
 import imagesize  # type: ignore
 
-from kaleidoscope import model, renderer
+from kaleidoscope import model, renderer, store
+from kaleidoscope.compress import compress_output, compressed_original, \
+    get_compressors
+from kaleidoscope.backends import ConvertBackend, get_backend, shrink_factor
+from kaleidoscope.config import BuildConfig
+from kaleidoscope.exif import read_metadata, metadata_to_json, \
+    metadata_from_json
+from kaleidoscope.manifest import Manifest, MANIFEST_NAME, file_hash
+from kaleidoscope.shard import move_albums, shard_manifests
+from kaleidoscope.staging import staged_output
+from kaleidoscope.store import DerivativeStore, store_path
 
 
-SIZES = {'thumb': (330, 220), 'large': (1500, 1000)}
+ROLES = ('thumb', 'large')
+PHOTOS_JSON = 'photos.json'
+YEAR_PAGE_NAME = re.compile(r'^\d+\.html$')
+SIZE_DIR_NAME = re.compile(r'^({})(-\d+)?$'.format('|'.join(ROLES)))
+# Additional formats of resized images by preference, with their MIME types
+FORMATS = {'avif': 'image/avif', 'webp': 'image/webp'}
+
+
+def image_sizes(config):
+    """Sizes of resized images by name, for the build config.
+
+    The first size of each role (thumbnail or large image) is named by the
+    role, other sizes in its ladder also by their width, e.g. 'thumb-660'.
+    Names are used as directories of resized images.
+    """
+    sizes = {}
+    for role in ROLES:
+        ladder = getattr(config, role + '_sizes')
+        for index, geometry in enumerate(ladder):
+            name = role if index == 0 else '{}-{}'.format(role, geometry[0])
+            sizes[name] = tuple(geometry)
+    return sizes
+
+
+SIZES = image_sizes(BuildConfig())
 
 
 class DefaultListener:
@@ -16,81 +55,887 @@ class DefaultListener:
     def starting_album(self, album, photos_to_process):
         pass
 
-    def finishing_album(self):
+    def finishing_album(self, album):
         pass
 
     def resizing_photo(self, photo):
         pass
 
+    def photo_resized(self, album, photo, wall_time, cpu_time):
+        """Photo was resized in `wall_time` seconds, using `cpu_time` seconds
+        of CPU time in the worker thread (excluding external processes)."""
+        pass
+
+    def stage_finished(self, stage, album, wall_time, cpu_time):
+        """Stage of the build finished in `wall_time` seconds of wall time and
+        `cpu_time` seconds of CPU time of its thread.
+
+        Stages are 'assets', 'gallery_index', 'prune', 'compress' (with album
+        None) and 'scan', 'metadata', 'render' for each album. Command line
+        interface reports also 'read' stage (reading of the gallery).
+        """
+        pass
+
+
+class ListenerGroup(DefaultListener):
+    """Listener forwarding events to several listeners."""
+    def __init__(self, *listeners):
+        self.listeners = listeners
+
+    def starting_album(self, album, photos_to_process):
+        for listener in self.listeners:
+            listener.starting_album(album, photos_to_process)
+
+    def finishing_album(self, album):
+        for listener in self.listeners:
+            listener.finishing_album(album)
+
+    def resizing_photo(self, photo):
+        for listener in self.listeners:
+            listener.resizing_photo(photo)
+
+    def photo_resized(self, album, photo, wall_time, cpu_time):
+        for listener in self.listeners:
+            listener.photo_resized(album, photo, wall_time, cpu_time)
+
+    def stage_finished(self, stage, album, wall_time, cpu_time):
+        for listener in self.listeners:
+            listener.stage_finished(stage, album, wall_time, cpu_time)
 
-def generate(gallery, output, listener=DefaultListener()):
-    """Generate the whole gallery.
 
+class Stopwatch:
+    """Measures wall time and CPU time of the current thread."""
+    def __init__(self):
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+
+    def elapsed(self):
+        """Return wall time and CPU time since the stopwatch was created."""
+        return (time.perf_counter() - self._wall,
+                time.thread_time() - self._cpu)
+
+
+def generate(gallery, output, listener=DefaultListener(),
+             config=BuildConfig(), shard=None):
+    """Generate the whole gallery, or only albums of the shard.
+
+    With `config.staging`, the whole gallery is generated in a staging
+    directory swapped with the output when finished (see staged_output).
     Events are reported to provided listener (see DefaultListener).
     """
-    copy_assets(output)
-    generate_gallery_index(gallery, output)
-    for album in gallery.albums:
-        album_output = os.path.join(output, album.name)
-        to_resize = [p for p in album.photos if needs_resize(p, album_output)]
-
-        listener.starting_album(album, len(to_resize))
-        for photo in to_resize:
-            listener.resizing_photo(photo)
-            resize(photo, 'thumb', album_output)
-            resize(photo, 'large', album_output)
+    if config.staging and shard is None:
+        with staged_output(output) as staging:
+            Generator(staging, listener, config,
+                      store=store_path(output)).generate(gallery)
+        if config.dedupe:
+            # Entries were also linked from the previous build until now
+            store.collect(store_path(output))
+    else:
+        Generator(output, listener, config, shard).generate(gallery)
+
+
+class Generator:
+    """Generator of the gallery output. Outputs are updated only when their
+    inputs recorded in the manifest changed. Events are reported to provided
+    listener (see DefaultListener) from the calling thread."""
+    def __init__(self, output, listener=DefaultListener(),
+                 config=BuildConfig(), shard=None, store=None):
+        self.output = output
+        self.listener = listener
+        self.config = config
+        self.shard = shard
+        self.backend = get_backend(config.resize_backend)
+        self.sizes = image_sizes(config)
+        self.params = resize_params(self.backend, self.sizes)
+        self.formats = ()
+        if config.formats:
+            supported = self.backend.supported_formats()
+            self.formats = tuple(name for name in FORMATS
+                                 if name in config.formats
+                                 and name in supported)
+        self.compressors = get_compressors(config.compress)
+        self.store = None
+        if config.dedupe:
+            self.store = DerivativeStore(store or store_path(output),
+                                         self.params, self.formats)
+        manifest_name = MANIFEST_NAME if shard is None else shard.manifest_name
+        self.manifest = Manifest.load(output, config.content_hash,
+                                      manifest_name)
+        self.covers = {}  # album name -> thumbnail of the first photo
+        self.produced = {}  # album name -> names of photos of the album
+
+    def generate(self, gallery, albums=None):
+        """Generate the gallery index and given albums (all by default)."""
+        if albums is None:
+            albums = gallery.albums
+        if self.shard is not None:
+            albums = [a for a in albums if self.shard.contains(a.name)]
+            self._set_asset_versions()
+            try:
+                self._run_pipeline(gallery, albums)
+                self._prune(gallery)
+            finally:
+                self.manifest.save()
+            return
+        self._copy_assets()
+        index_last = self.config.year_pages or self.config.album_covers
+        try:
+            if not index_last:
+                self._generate_index(gallery)
+            self._run_pipeline(gallery, albums)
+            if index_last:
+                self._generate_index(gallery)
+            self._prune(gallery)
+            self._collect_store()
+            self._compress()
+        finally:
+            self.manifest.save()
+
+    def merge(self, gallery, shard_outputs=()):
+        """Combine outputs of shards and generate the gallery index.
+
+        Manifests of shards built into the output are merged into the main
+        manifest. Albums built into other `shard_outputs` are moved into the
+        output first.
+        """
+        os.makedirs(self.output, exist_ok=True)
+        for shard_output in (self.output,) + tuple(shard_outputs):
+            for name, shard in shard_manifests(shard_output):
+                if shard_output != self.output:
+                    move_albums(shard_output, self.output, shard)
+                path = os.path.join(shard_output, name)
+                self.manifest.merge(Manifest.load(shard_output, name=name),
+                                    shard.contains)
+                shutil.rmtree(path)
+        self._copy_assets()
+        try:
+            if self.config.album_covers:
+                for album in gallery.albums:
+                    self._read_cover(album)
+            self._generate_index(gallery)
+            self._prune(gallery)
+            self._collect_store()
+            self._compress()
+        finally:
+            self.manifest.save()
+
+    def _copy_assets(self):
+        stopwatch = Stopwatch()
+        copy_assets(self.output)
+        self._set_asset_versions()
+        self.listener.stage_finished('assets', None, *stopwatch.elapsed())
+
+    def _set_asset_versions(self):
+        renderer.set_asset_versions(
+            asset_versions() if self.config.fingerprint else {})
+
+    def _compress(self):
+        previous = self.manifest.compressed_copies()
+        if not self.compressors and not previous:
+            return
+        stopwatch = Stopwatch()
+        copies, _ = compress_output(self.output, self.compressors,
+                                    self.config.jobs, previous)
+        self.manifest.record_compressed(copies)
+        self.listener.stage_finished('compress', None, *stopwatch.elapsed())
+
+    def _prune(self, gallery):
+        """Remove outputs of albums no longer in the gallery (except in
+        a shard, which does not know all albums) and outputs of photos no
+        longer in albums generated since the last pruning.
+
+        Removed photos are found in the manifest. Resized images of generated
+        albums are listed only if sizes or formats changed."""
+        stopwatch = Stopwatch()
+        pruned = False
+        if self.shard is None:
+            album_names = {album.name for album in gallery.albums}
+            for name in self.manifest.prune_albums(album_names):
+                path = os.path.join(self.output, name)
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                    pruned = True
+        removed = self.manifest.prune_photos(self.produced)
+        layout = {'sizes': sorted(self.sizes), 'formats': list(self.formats)}
+        if self.produced and self.manifest.resized_layout() != layout:
+            # Look for sizes and formats no longer used
+            for album_name, photo_names in self.produced.items():
+                pruned |= prune_album(os.path.join(self.output, album_name),
+                                      photo_names, self.formats, self.sizes)
+            self.manifest.record_resized_layout(layout)
+        else:
+            for album_name, photo_names in removed.items():
+                pruned |= remove_resized(
+                    os.path.join(self.output, album_name), photo_names,
+                    self.formats, self.sizes)
+        self.produced = {}
+        if pruned and self.store is not None:
+            self.store.modified = True
+        self.listener.stage_finished('prune', None, *stopwatch.elapsed())
+
+    def _collect_store(self):
+        if self.store is not None and self.store.modified:
+            self.store.collect()
+
+    def _read_cover(self, album):
+        """Read metadata of the cover of an album generated before."""
+        album_output = os.path.join(self.output, album.name)
+        photo = next(album.photos, None)
+        if photo is not None and photo_key(album, photo) in self.manifest:
+            self._read_resized_metadata(album, photo, album_output, {})
+            self.covers[album.name] = photo.thumb
+        album.release()
+
+    def _generate_index(self, gallery):
+        stopwatch = Stopwatch()
+        covers = self.covers if self.config.album_covers else None
+        generate_gallery_index(gallery, self.output, self.manifest, covers,
+                               self.config.year_pages)
+        self.listener.stage_finished('gallery_index', None,
+                                     *stopwatch.elapsed())
+
+    def _run_pipeline(self, gallery, albums):
+        """Scan, resize and render albums. Photos are resized by a pool of
+        worker threads and each album page is rendered by a separate thread
+        as soon as its own photos are resized."""
+        jobs = self.config.jobs or os.cpu_count()
+        queue_size = 2 * jobs
+        albums = iter(albums)
+        waiting = deque()  # (album job, photo) waiting for resizing
+        resizing = {}  # future -> (album job, photo)
+        rendering = {}  # future -> album job
+        budget = self.config.pixel_budget
+        if budget is not None:
+            budget *= 1000000
+        pixels = 0  # estimated pixels decoded by resizing photos
+        with ThreadPoolExecutor(max_workers=jobs) as resize_pool, \
+                ThreadPoolExecutor(max_workers=1) as page_pool:
+            while True:
+                # Scan new albums only when there is room in both queues
+                while len(waiting) < queue_size and \
+                        len(rendering) < queue_size:
+                    album = next(albums, None)
+                    if album is None:
+                        break
+                    job = self._scan_album(album)
+                    if job.remaining == 0:
+                        future = page_pool.submit(self._finish_album,
+                                                  gallery, job)
+                        rendering[future] = job
+                    waiting.extend((job, photo) for photo in job.to_resize)
+                while waiting and len(resizing) < queue_size:
+                    job, photo = waiting[0]
+                    cost = job.costs.get(photo.name, 0)
+                    if budget is not None and resizing and \
+                            pixels + cost > budget:
+                        break
+                    waiting.popleft()
+                    pixels += cost
+                    future = resize_pool.submit(
+                        _timed, self._resize, photo, job.output,
+                        job.outdated.get(photo.name, ()),
+                        job.source_sizes.get(photo.name))
+                    resizing[future] = (job, photo)
+                if not resizing and not rendering:
+                    break
+                done, _ = wait(list(resizing) + list(rendering),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future in rendering:
+                        future.result()
+                        job = rendering.pop(future)
+                        if job.cover is not None:
+                            self.covers[job.album.name] = job.cover
+                        self.produced[job.album.name] = job.photo_names
+                        for stage, wall_time, cpu_time in job.timings:
+                            self.listener.stage_finished(
+                                stage, job.album, wall_time, cpu_time)
+                        self.listener.finishing_album(job.album)
+                        continue
+                    job, photo = resizing.pop(future)
+                    pixels -= job.costs.get(photo.name, 0)
+                    result, wall_time, cpu_time = future.result()
+                    sizes, placeholder, metadata = result
+                    job.known_sizes[photo.name] = sizes
+                    if placeholder is not None:
+                        job.placeholders[photo.name] = placeholder
+                    job.metadata[photo.name] = metadata
+                    self.manifest.record(photo_key(job.album, photo),
+                                         photo.source_path, self.params)
+                    self.listener.resizing_photo(photo)
+                    self.listener.photo_resized(job.album, photo, wall_time,
+                                                cpu_time)
+                    job.remaining -= 1
+                    if job.remaining == 0:
+                        future = page_pool.submit(self._finish_album,
+                                                  gallery, job)
+                        rendering[future] = job
+
+    def _resize(self, photo, album_output, overwrite, source_size=None):
+        """Resize the photo, computing its placeholder if enabled, and read
+        its metadata while the source is likely still in the page cache."""
+        placeholder = None
+        if self.store is not None:
+            sizes, placeholder = self._resize_stored(photo, album_output,
+                                                     source_size)
+        elif self.config.placeholders:
+            sizes, placeholder = resize(
+                photo, album_output, self.backend, overwrite, self.formats,
+                self.sizes, source_size, placeholder=True)
+        else:
+            sizes = resize(photo, album_output, self.backend, overwrite,
+                           self.formats, self.sizes, source_size)
+        return sizes, placeholder, read_metadata(photo.source_path)
+
+    def _resize_stored(self, photo, album_output, source_size=None):
+        """Resize the photo into the store, unless it is already stored, and
+        link resized images into the album output."""
+        stored = model.Photo('image' + os.path.splitext(photo.name)[1], '', '',
+                             photo.source_path)
+        placeholders = self.config.placeholders
+        entry, result = self.store.get(
+            self.store.key(photo.source_path),
+            lambda path: resize(stored, path, self.backend,
+                                formats=self.formats, sizes=self.sizes,
+                                source_size=source_size,
+                                placeholder=placeholders))
+        for size_name in self.sizes:
+            for stored_path, path in zip(
+                    _resized_paths(entry, size_name, stored, self.formats),
+                    _resized_paths(album_output, size_name, photo,
+                                   self.formats)):
+                self.store.link(stored_path, path)
+        if result is None:
+            # Already stored
+            return {}, None
+        return result if placeholders else (result, None)
+
+    def _scan_album(self, album):
+        """Find photos of the album that need to be resized."""
+        stopwatch = Stopwatch()
+        job = _AlbumJob(album, os.path.join(self.output, album.name))
+        for photo in album.photos:
+            key = photo_key(album, photo)
+            outdated = self.manifest.outdated_sizes(key, photo.source_path,
+                                                    self.params)
+            if outdated:
+                job.outdated[photo.name] = outdated
+            if outdated or needs_resize(photo, job.output, self.formats,
+                                        self.sizes):
+                job.to_resize.append(photo)
+                if self.config.pixel_budget is not None:
+                    self._estimate_cost(job, photo)
+        job.remaining = len(job.to_resize)
+        self.listener.starting_album(album, len(job.to_resize))
+        self.listener.stage_finished('scan', album, *stopwatch.elapsed())
+        return job
+
+    def _estimate_cost(self, job, photo):
+        """Read size of the source photo and estimate number of pixels
+        decoded when it is resized."""
+        width, height = imagesize.get(photo.source_path)
+        if width <= 0 or height <= 0:
+            return
+        job.source_sizes[photo.name] = (width, height)
+        largest = _sizes_from_largest(self.sizes)[0][1]
+        factor = shrink_factor(photo.source_path, (width, height), largest)
+        job.costs[photo.name] = (width // factor) * (height // factor)
+
+    def _finish_album(self, gallery, job):
+        """Read resized images metadata and generate album index.
+
+        Photos of the album are released afterwards, if they can be loaded
+        again (see Album.release). Durations of both stages are stored in the
+        job, to be reported by the calling thread.
+        """
+        album = job.album
+        manifest = self.manifest
+        stopwatch = Stopwatch()
         for photo in album.photos:
-            photo.thumb = read_resized_metadata(photo, 'thumb', album_output)
-            photo.large = read_resized_metadata(photo, 'large', album_output)
-        generate_album_index(gallery, album, album_output)
-        listener.finishing_album()
+            job.photo_names.add(photo.name)
+            key = photo_key(album, photo)
+            if key not in manifest:
+                # Resized by an older version, without manifest
+                manifest.record(key, photo.source_path, self.params)
+            self._read_resized_metadata(
+                album, photo, job.output, job.known_sizes.get(photo.name, {}),
+                job.placeholders.get(photo.name), job.metadata.get(photo.name))
+            if job.cover is None:
+                job.cover = photo.thumb
+        job.timings.append(('metadata',) + stopwatch.elapsed())
+        stopwatch = Stopwatch()
+        generate_album_index(gallery, album, job.output, manifest,
+                             self.config.chunk_size, self.config.fingerprint)
+        job.timings.append(('render',) + stopwatch.elapsed())
+        album.release()
+
+    def _read_resized_metadata(self, album, photo, album_output, sizes,
+                               placeholder=None, metadata=None):
+        """Fill metadata of resized images and of the source of the photo,
+        using `sizes`, `placeholder` and `metadata` reported by resizing."""
+        key = photo_key(album, photo)
+        resized = {
+            name: _cached_resized_metadata(
+                self.manifest, key, photo, name, album_output,
+                sizes.get(name), self.formats, self.config.fingerprint)
+            for name in self.sizes
+        }
+        photo.thumb = _with_variants(resized, 'thumb')
+        photo.large = _with_variants(resized, 'large')
+        if self.config.placeholders:
+            photo.placeholder = self._placeholder(key, photo, album_output,
+                                                  placeholder)
+        photo.metadata = self._photo_metadata(key, photo, metadata)
+
+    def _photo_metadata(self, key, photo, computed=None):
+        """Metadata of the photo, as recorded in the manifest if it was not
+        read by resizing."""
+        if computed is None:
+            recorded = self.manifest.photo_metadata(key)
+            if recorded is not None:
+                return metadata_from_json(recorded)
+            # Resized by an older version
+            computed = read_metadata(photo.source_path)
+        self.manifest.record_metadata(key, metadata_to_json(computed))
+        return computed
+
+    def _placeholder(self, key, photo, album_output, computed=None):
+        """Placeholder of the photo, as recorded in the manifest if its
+        thumbnail did not change since."""
+        path = resized_image_path(album_output, 'thumb', photo)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        placeholder = computed or \
+            self.manifest.resized_placeholder(key, 'thumb', stat)
+        if placeholder is None:
+            placeholder = self.backend.placeholder(path)
+        self.manifest.record_placeholder(key, 'thumb', placeholder)
+        return placeholder
+
+
+class _AlbumJob:
+    """Album being processed by the generator pipeline."""
+    def __init__(self, album, output):
+        self.album = album
+        self.output = output
+        self.to_resize = []
+        self.outdated = {}  # photo name -> names of outdated sizes
+        self.remaining = 0
+        self.known_sizes = {}
+        self.source_sizes = {}
+        self.costs = {}  # estimated decoded pixels
+        self.placeholders = {}
+        self.metadata = {}
+        self.timings = []
+        self.cover = None
+        self.photo_names = set()
+
 
+def _timed(function, *args):
+    """Call the function; return its result, wall time and CPU time."""
+    stopwatch = Stopwatch()
+    result = function(*args)
+    return (result,) + stopwatch.elapsed()
 
-def generate_gallery_index(gallery, output):
+
+def _cached_resized_metadata(manifest, key, photo, size_name, album_output,
+                             size=None, formats=(), fingerprint=False):
+    """Create resized image metadata, using the size (and content hash, if
+    `fingerprint` is set) recorded in the manifest if the resized file did not
+    change since."""
+    path = resized_image_path(album_output, size_name, photo)
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return read_resized_metadata(photo, size_name, album_output, size,
+                                     formats)
+    if size is None:
+        size = manifest.resized_size(key, size_name, stat)
+    content_hash = None
+    format_files = {}  # image format -> stat, content hash
+    if fingerprint:
+        content_hash = manifest.resized_hash(key, size_name, path, stat)
+        for image_format in formats:
+            format_path = resized_image_path(album_output, size_name, photo,
+                                             image_format)
+            try:
+                format_stat = os.stat(format_path)
+            except FileNotFoundError:
+                continue
+            format_files[image_format] = (format_stat, manifest.resized_hash(
+                key, size_name + '.' + image_format, format_path,
+                format_stat))
+    resized = read_resized_metadata(
+        photo, size_name, album_output, size, formats, _version(content_hash),
+        {image_format: _version(format_hash)
+         for image_format, (_, format_hash) in format_files.items()})
+    manifest.record_resized(key, size_name, stat, resized.size, content_hash)
+    for image_format, (format_stat, format_hash) in format_files.items():
+        # Recorded like a size of its own, with dimensions of the size
+        manifest.record_resized(key, size_name + '.' + image_format,
+                                format_stat, resized.size, format_hash)
+    return resized
+
+
+def _with_variants(resized, role):
+    """Resized image of the role with other sizes of its ladder."""
+    variants = tuple(image for name, image in resized.items()
+                     if name.startswith(role + '-'))
+    return resized[role]._replace(variants=variants)
+
+
+def photo_key(album, photo):
+    """Identifier of the photo in the build manifest."""
+    return album.name + '/' + photo.name
+
+
+def resize_params(backend, sizes=SIZES):
+    """Parameters affecting resized images of each size, as recorded in the
+    manifest."""
+    backend_version = backend.name + '-' + backend.version
+    return {
+        name: {'geometry': list(geometry), 'backend': backend_version}
+        for name, geometry in sizes.items()
+    }
+
+
+def generate_gallery_index(gallery, output, manifest=None, covers=None,
+                           year_pages=False):
+    """Generate the gallery index, listing all albums.
+
+    With `year_pages`, the index lists only years and each year has its own
+    page listing its albums. Year pages recorded in the manifest are removed
+    if their year has no albums.
+    `covers` are thumbnails shown for albums, by album name.
+    """
     path = os.path.join(output, "index.html")
     context = {'gallery': gallery, 'current_year': date.today().year}
-    renderer.render('gallery.html', path, context)
+    if covers is not None:
+        context['covers'] = covers
+    else:
+        covers = {}
+    page_inputs = (gallery.title, gallery.author, context['current_year'])
+    if not year_pages:
+        inputs = page_inputs + (
+            [(a.name, a.title, a.date, covers.get(a.name))
+             for a in gallery.albums],)
+        _render_page('gallery.html', path, context, inputs, manifest)
+        _remove_year_pages(output, [], manifest)
+        return
+    albums_by_year = gallery.albums_by_year
+    years = [year for year, _ in albums_by_year]
+    for year, albums in albums_by_year:
+        year_context = dict(context, year=year, albums=albums, years=years)
+        inputs = page_inputs + (year, years, [
+            (a.name, a.title, a.date, covers.get(a.name)) for a in albums])
+        _render_page('year.html', year_page_path(output, year), year_context,
+                     inputs, manifest)
+    # Each year is represented by its latest album
+    latest = [(year, albums[0]) for year, albums in albums_by_year]
+    inputs = page_inputs + (
+        [(year, covers.get(album.name)) for year, album in latest],)
+    _render_page('years.html', path, dict(context, years=latest), inputs,
+                 manifest)
+    _remove_year_pages(output, years, manifest)
+
 
+def year_page_path(output, year):
+    return os.path.join(output, "{}.html".format(year))
 
-def generate_album_index(gallery, album, album_output):
+
+def _remove_year_pages(output, years, manifest):
+    """Remove year pages recorded in the manifest for years not in the list.
+    Other files in the output are never removed."""
+    if manifest is None:
+        return
+    keep = {os.path.basename(year_page_path(output, year))
+            for year in years}
+    for path in manifest.page_paths():
+        name = os.path.relpath(path, output)
+        if YEAR_PAGE_NAME.match(name) and name not in keep:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            manifest.forget_page(path)
+
+
+def generate_album_index(gallery, album, album_output, manifest=None,
+                         chunk_size=None, fingerprint=False):
+    """Generate the album page.
+
+    With `chunk_size`, only first photos are included in the page and all
+    photos are written into a JSON file. If `fingerprint` is set, its URL
+    contains a version of its content.
+    """
     context = {
         'album': album,
         'gallery': gallery,
         'current_year': date.today().year,
     }
+    photos_path = os.path.join(album_output, PHOTOS_JSON)
+    if chunk_size:
+        sections = album.sections
+        context['inline'] = _first_photos(sections, chunk_size)
+        renderer.write_if_changed(photos_path, album_photos_json(album))
+        if sum(len(section.photos) for section in sections) > chunk_size:
+            version = _version(file_hash(photos_path)) if fingerprint \
+                else None
+            context['photos_url'] = _versioned(PHOTOS_JSON, version)
+            context['chunk_size'] = chunk_size
+    elif os.path.exists(photos_path):
+        os.remove(photos_path)
     index_path = os.path.join(album_output, "index.html")
-    renderer.render('album.html', index_path, context)
+    inputs = (gallery.title, gallery.author, context['current_year'], album,
+              chunk_size, context.get('photos_url'))
+    _render_page('album.html', index_path, context, inputs, manifest)
+
+
+def _first_photos(sections, count):
+    """Split first `count` photos of the album by sections."""
+    result = []
+    for section in sections:
+        result.append(section.photos[:count])
+        count = max(0, count - len(section.photos))
+    return result
+
+
+def album_photos_json(album):
+    """Describe photos of the album for the frontend in a compact JSON.
+
+    Each section has its name, flag if it is the default section and a list
+    of photos. Each photo is described by URLs and sizes of its thumbnail
+    and large image, with `srcset` in each format, and its captions.
+    """
+    def image(resized):
+        return {
+            'url': resized.url,
+            'size': resized.size,
+            'srcset': renderer.srcset(resized),
+            'sources': [[mime_type, renderer.srcset(resized, mime_type)]
+                        for mime_type, _ in resized.sources],
+        }
+    sections = [{
+        'name': section.name,
+        'default': section.is_default(),
+        'photos': [{
+            'thumb': image(photo.thumb),
+            'large': image(photo.large),
+            'placeholder': photo.placeholder,
+            'caption': photo.short_caption,
+            'description': photo.long_caption,
+        } for photo in section.photos],
+    } for section in album.sections]
+    return json.dumps({'sections': sections}, ensure_ascii=False,
+                      separators=(',', ':'))
+
+
+def _render_page(template_name, path, context, inputs, manifest):
+    """Render the page, unless it was rendered from the same inputs by the
+    previous build recorded in the manifest."""
+    if manifest is not None:
+        key = renderer.inputs_key(template_name, inputs)
+        if manifest.is_page_current(path, key):
+            return
+    renderer.render(template_name, path, context)
+    if manifest is not None:
+        manifest.record_page(path, key)
 
 
-def resized_image_path(album_output, size_name, photo):
-    return os.path.join(album_output, size_name, photo.name)
+def resized_image_path(album_output, size_name, photo, image_format=None):
+    """Path of the resized photo, optionally in an additional format."""
+    path = os.path.join(album_output, size_name, photo.name)
+    if image_format is not None:
+        path += '.' + image_format
+    return path
 
 
-def needs_resize(photo, album_output):
-    thumb_path = resized_image_path(album_output, 'thumb', photo)
-    large_path = resized_image_path(album_output, 'large', photo)
-    return not os.path.exists(thumb_path) or not os.path.exists(large_path)
+def prune_album(album_output, photo_names, formats=(), sizes=SIZES):
+    """Remove directories of sizes not in `sizes` and resized images of
+    photos not in `photo_names` from the album output. Returns True if
+    anything was removed."""
+    expected = set(photo_names)
+    expected.update(name + '.' + image_format for name in photo_names
+                    for image_format in formats)
+    pruned = False
+    if not os.path.isdir(album_output):
+        return pruned
+    for entry in os.scandir(album_output):
+        if not entry.is_dir() or not SIZE_DIR_NAME.match(entry.name):
+            continue
+        if entry.name not in sizes:
+            shutil.rmtree(entry.path)
+            pruned = True
+            continue
+        for image in os.scandir(entry.path):
+            if image.name not in expected:
+                os.remove(image.path)
+                pruned = True
+    return pruned
 
 
-def read_resized_metadata(photo, size_name, album_output):
+def remove_resized(album_output, photo_names, formats=(), sizes=SIZES):
+    """Remove resized images of photos given by names from the album output.
+    Returns True if anything was removed."""
+    pruned = False
+    for name in photo_names:
+        photo = model.Photo(name, '', '', '')
+        for size_name in sizes:
+            for path in _resized_paths(album_output, size_name, photo,
+                                       formats):
+                try:
+                    os.remove(path)
+                    pruned = True
+                except FileNotFoundError:
+                    pass
+    return pruned
+
+
+def needs_resize(photo, album_output, formats=(), sizes=SIZES):
+    return any(not os.path.exists(path)
+               for size_name in sizes
+               for path in _resized_paths(album_output, size_name, photo,
+                                          formats))
+
+
+def _resized_paths(album_output, size_name, photo, formats):
+    return [resized_image_path(album_output, size_name, photo)] + \
+        [resized_image_path(album_output, size_name, photo, image_format)
+         for image_format in formats]
+
+
+def read_resized_metadata(photo, size_name, album_output, size=None,
+                          formats=(), version=None, format_versions=None):
+    """Create resized image metadata, reading its size from the file unless
+    it is already known.
+
+    If `version` is given, it is added to URLs as a query string. Versions
+    of images in additional formats are given by `format_versions`.
+    """
     url = "{}/{}".format(size_name, photo.name)
-    size = imagesize.get(resized_image_path(album_output, size_name, photo))
-    return model.ResizedImage(url, size)
+    format_versions = format_versions or {}
+    if size is None:
+        size = imagesize.get(
+            resized_image_path(album_output, size_name, photo))
+    sources = tuple((FORMATS[image_format],
+                     _versioned(url + '.' + image_format,
+                                format_versions.get(image_format)))
+                    for image_format in formats)
+    return model.ResizedImage(_versioned(url, version), tuple(size), sources)
+
+
+def _versioned(url, version):
+    return url if version is None else url + '?v=' + version
 
 
-def resize(photo, size, album_output):
-    target = resized_image_path(album_output, size, photo)
-    geometry = SIZES[size]
-    if not os.path.exists(target):
-        os.makedirs(os.path.dirname(target), exist_ok=True)
-        subprocess.run(['convert', photo.source_path,
-                        '-auto-orient', '-resize', "{}x{}>".format(*geometry),
-                        target])
+def resize(photo, album_output, backend=ConvertBackend(), overwrite=(),
+           formats=(), sizes=SIZES, source_size=None, placeholder=False):
+    """Create all missing resized versions of the photo and versions of
+    sizes named in `overwrite`.
+
+    The source is decoded only once. Sizes are produced from the largest to
+    the smallest, each one resized from the previous in-memory image, so
+    the thumbnail is always derived from the same pixels as the large image.
+    Each size is written in the format of the source and in additional
+    `formats`.
+
+    If size of the source is known, JPEG sources much larger than the
+    largest size are shrunk already while decoding.
+
+    Returns sizes of created images reported by the backend, by size name.
+    With `placeholder`, returns also the placeholder colour computed by the
+    backend if the thumbnail was written, otherwise None.
+    """
+    outputs = []
+    written = []
+    for size, geometry in _sizes_from_largest(sizes):
+        targets = [path for path in
+                   _resized_paths(album_output, size, photo, formats)
+                   if size in overwrite or not os.path.exists(path)]
+        if targets:
+            os.makedirs(os.path.dirname(targets[0]), exist_ok=True)
+            written.append(size)
+        for path in targets:
+            # Replace the file, it can be linked from another output
+            if os.path.exists(path):
+                os.remove(path)
+        outputs.append((geometry, targets))
+    while outputs and not outputs[-1][1]:
+        outputs.pop()
+    colour = None
+    if not outputs:
+        results = []
+    elif placeholder and 'thumb' in written:
+        results, colour = backend.resize(photo.source_path, outputs,
+                                         source_size=source_size,
+                                         placeholder=True)
+    else:
+        results = backend.resize(photo.source_path, outputs,
+                                 source_size=source_size)
+    sizes = {name: size for name, size in zip(written, results)
+             if size is not None}
+    return (sizes, colour) if placeholder else sizes
+
+
+def _sizes_from_largest(sizes):
+    return sorted(sizes.items(), key=lambda item: item[1][0] * item[1][1],
+                  reverse=True)
+
+
+def asset_versions():
+    """Versions of package assets derived from their content, by path
+    relative to the output directory."""
+    assets_path = os.path.join(os.path.dirname(__file__), 'assets')
+    versions = {}
+    for directory, _, files in os.walk(assets_path):
+        for name in files:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, os.path.dirname(assets_path))
+            versions[relative.replace(os.sep, '/')] = _version(file_hash(path))
+    return versions
+
+
+def _version(content_hash):
+    """Short version identifier for URLs derived from the content hash."""
+    return None if content_hash is None else content_hash[:10]
 
 
 def copy_assets(output):
+    """Synchronize assets directory in the output with package assets.
+
+    Only changed files are copied and files not present in package assets are
+    removed.
+    """
     assets_path = os.path.join(os.path.dirname(__file__), 'assets')
     assets_output_path = os.path.join(output, 'assets')
-    if os.path.exists(assets_output_path):
-        shutil.rmtree(assets_output_path)
-    shutil.copytree(str(assets_path), str(assets_output_path))
+    _sync_directory(assets_path, assets_output_path)
+
+
+def _sync_directory(source, target):
+    os.makedirs(target, exist_ok=True)
+    source_names = set(os.listdir(source))
+    for entry in os.scandir(target):
+        if entry.name not in source_names and \
+                compressed_original(entry.name) not in source_names:
+            if entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path)
+            else:
+                os.remove(entry.path)
+    for name in source_names:
+        source_path = os.path.join(source, name)
+        target_path = os.path.join(target, name)
+        if os.path.isdir(source_path):
+            if os.path.isfile(target_path):
+                os.remove(target_path)
+            _sync_directory(source_path, target_path)
+        elif os.path.isdir(target_path):
+            shutil.rmtree(target_path)
+            shutil.copy2(source_path, target_path)
+        elif not os.path.exists(target_path):
+            shutil.copy2(source_path, target_path)
+        elif not filecmp.cmp(source_path, target_path, shallow=False):
+            # Replace the file, it can be linked from another output
+            os.remove(target_path)
+            shutil.copy2(source_path, target_path)
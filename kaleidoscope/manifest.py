@@ -0,0 +1,381 @@
+import hashlib
+import json
+import os
+
+MANIFEST_NAME = '.kaleidoscope-cache'
+FORMAT_VERSION = 1
+INDEX = 'index.json'
+ALBUMS_DIR = 'albums'
+
+
+class Manifest:
+    """Record of photos resized by previous builds.
+
+    Photos are identified by their path relative to the gallery directory
+    (album name and file name). For each photo the manifest records size and
+    modification time of the source, optionally its content hash, and resize
+    parameters used to create its derivatives, by size name. Dimensions of
+    the resized images are recorded too, together with their file size and
+    modification time, so they do not need to be read again by the next
+    build. Content hashes and placeholder colours of resized images are
+    recorded in the same way, if requested. Metadata read from the source
+    (see kaleidoscope.exif) is recorded with the photo.
+
+    Generated pages are recorded by their path relative to the output
+    directory with a key identifying inputs used to render them. Paths of
+    written compressed copies (see kaleidoscope.compress) are recorded too.
+
+    The manifest is a directory. Records of photos and pages of each album
+    are saved in a separate file, written only when the album changed, so
+    a rebuild of a few albums (e.g. by the watch command) does not rewrite
+    records of the whole gallery. Other records are saved in an index file.
+
+    A build of a part of the gallery (shard) saves the manifest under
+    a different name, so several shards can be built into the same output.
+    Manifests of shards are then merged into the main one.
+    """
+    def __init__(self, path, content_hash=False):
+        self.path = path
+        self.content_hash = content_hash
+        self._photos = {}
+        self._pages = {}
+        self._compressed = []
+        self._layout = None
+        self._modified = False
+        self._modified_albums = set()
+
+    @classmethod
+    def load(cls, output, content_hash=False, name=MANIFEST_NAME):
+        """Load manifest from the output directory, if it exists.
+
+        If manifest with the given name does not exist, the main manifest is
+        loaded, but it will be saved under the given name.
+        """
+        manifest = cls(os.path.join(output, name), content_hash)
+        main_path = os.path.join(output, MANIFEST_NAME)
+        for path in (manifest.path, main_path):
+            if os.path.exists(path):
+                manifest._read(path)
+                if path != manifest.path:
+                    # Save all records under the new name
+                    manifest._modified = True
+                    manifest._modified_albums = manifest._album_names()
+                break
+        return manifest
+
+    def _read(self, path):
+        try:
+            with open(os.path.join(path, INDEX)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') != FORMAT_VERSION:
+            return
+        self._pages = data.get('pages', {})
+        self._compressed = data.get('compressed', [])
+        self._layout = data.get('layout')
+        albums_path = os.path.join(path, ALBUMS_DIR)
+        if not os.path.isdir(albums_path):
+            return
+        for name in os.listdir(albums_path):
+            album, extension = os.path.splitext(name)
+            if extension != '.json':
+                continue
+            try:
+                with open(os.path.join(albums_path, name)) as f:
+                    records = json.load(f)
+            except (OSError, ValueError):
+                continue
+            self._photos.update((album + '/' + photo, entry)
+                                for photo, entry in records['photos'].items())
+            self._pages.update(records['pages'])
+
+    def save(self):
+        """Save records changed since last saved."""
+        index_path = os.path.join(self.path, INDEX)
+        if not self._modified and not self._modified_albums and \
+                os.path.exists(index_path):
+            return
+        albums_path = os.path.join(self.path, ALBUMS_DIR)
+        os.makedirs(albums_path, exist_ok=True)
+        albums = {album: {'photos': {}, 'pages': {}}
+                  for album in self._modified_albums}
+        for key, entry in self._photos.items():
+            album, _, photo = key.partition('/')
+            if album in albums:
+                albums[album]['photos'][photo] = entry
+        gallery_pages = {}
+        for name, page_key in self._pages.items():
+            album = _album_name(name)
+            if album is None:
+                gallery_pages[name] = page_key
+            elif album in albums:
+                albums[album]['pages'][name] = page_key
+        for album, records in albums.items():
+            path = os.path.join(albums_path, album + '.json')
+            if records['photos'] or records['pages']:
+                _write_json(path, records)
+            elif os.path.exists(path):
+                os.remove(path)
+        _write_json(index_path, {
+            'version': FORMAT_VERSION,
+            'pages': gallery_pages,
+            'compressed': self._compressed,
+            'layout': self._layout,
+        })
+        self._modified = False
+        self._modified_albums = set()
+
+    def _album_names(self):
+        names = {_album_name(name) for name in self._photos}
+        names.update(_album_name(name) for name in self._pages)
+        names.discard(None)
+        return names
+
+    def _changed(self, name):
+        """Mark the record of the photo key or page path changed."""
+        album = _album_name(name)
+        if album is None:
+            self._modified = True
+        else:
+            self._modified_albums.add(album)
+
+    def merge(self, other, owns_album):
+        """Take records of albums for which `owns_album(name)` is true from
+        the other manifest."""
+        def owned(name):
+            album = _album_name(name)
+            return album is not None and owns_album(album)
+        for records, other_records in ((self._photos, other._photos),
+                                       (self._pages, other._pages)):
+            for name in [name for name in records if owned(name)]:
+                del records[name]
+                self._changed(name)
+            for name, record in other_records.items():
+                if owned(name):
+                    records[name] = record
+                    self._changed(name)
+
+    def prune_albums(self, album_names):
+        """Remove records of albums not in `album_names`. Returns names of
+        removed albums."""
+        removed = set()
+        for records in (self._photos, self._pages):
+            for name in list(records):
+                album = _album_name(name)
+                if album is not None and album not in album_names:
+                    del records[name]
+                    removed.add(album)
+        self._modified_albums |= removed
+        return removed
+
+    def prune_photos(self, photo_names):
+        """Remove records of photos no longer in their albums, for albums in
+        `photo_names` (names of photos by album name). Returns names of
+        removed photos by album name."""
+        removed = {}
+        for key in list(self._photos):
+            album, _, photo = key.partition('/')
+            names = photo_names.get(album)
+            if names is not None and photo not in names:
+                del self._photos[key]
+                removed.setdefault(album, set()).add(photo)
+        self._modified_albums.update(removed)
+        return removed
+
+    def resized_layout(self):
+        """Sizes and formats of resized images, as recorded by
+        `record_resized_layout`, or None."""
+        return self._layout
+
+    def record_resized_layout(self, layout):
+        if self._layout != layout:
+            self._layout = layout
+            self._modified = True
+
+    def __contains__(self, key):
+        return key in self._photos
+
+    def is_outdated(self, key, source_path, params):
+        """Check if any derivatives of the photo were created from
+        a different source or with different parameters."""
+        return bool(self.outdated_sizes(key, source_path, params))
+
+    def outdated_sizes(self, key, source_path, params):
+        """Return names of sizes with derivatives created from a different
+        source or with different parameters (`params` by size name).
+
+        Photos that are not recorded are not considered outdated.
+        """
+        entry = self._photos.get(key)
+        if entry is None:
+            return set()
+        recorded = entry['params']
+        changed = {name for name, size_params in params.items()
+                   if recorded.get(name) != size_params}
+        if len(changed) == len(params) or \
+                self._is_source_current(key, source_path):
+            return changed
+        return set(params)
+
+    def _is_source_current(self, key, source_path):
+        entry = self._photos[key]
+        stat = os.stat(source_path)
+        if _same_file(entry, stat):
+            return True
+        if self.content_hash and entry.get('hash') is not None \
+                and entry['size'] == stat.st_size \
+                and entry['hash'] == file_hash(source_path):
+            # Source was touched, but not changed
+            entry['mtime'] = stat.st_mtime_ns
+            self._changed(key)
+            return True
+        return False
+
+    def record(self, key, source_path, params):
+        """Record the current state of the source and resize parameters.
+
+        Recorded resized images are kept, they are checked by their own
+        file state."""
+        stat = os.stat(source_path)
+        entry = self._photos.setdefault(key, {})
+        entry.update({
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'params': params,
+        })
+        if self.content_hash:
+            entry['hash'] = file_hash(source_path)
+        else:
+            entry.pop('hash', None)
+        self._changed(key)
+
+    def photo_metadata(self, key):
+        """Return recorded metadata of the source photo, or None."""
+        entry = self._photos.get(key)
+        return None if entry is None else entry.get('metadata')
+
+    def record_metadata(self, key, metadata):
+        """Record metadata of the source photo recorded before."""
+        entry = self._photos[key]
+        if entry.get('metadata') != metadata:
+            entry['metadata'] = metadata
+            self._changed(key)
+
+    def resized_size(self, key, size_name, stat):
+        """Return recorded dimensions of the resized image, or None if they
+        are not known or the file changed (according to its `stat`)."""
+        try:
+            resized = self._photos[key]['resized'][size_name]
+        except KeyError:
+            return None
+        if resized['size'] == stat.st_size and \
+                resized['mtime'] == stat.st_mtime_ns:
+            return tuple(resized['dimensions'])
+        return None
+
+    def resized_hash(self, key, size_name, path, stat):
+        """Return content hash of the resized image, computing it only if the
+        file changed since it was recorded (according to its `stat`)."""
+        try:
+            resized = self._photos[key]['resized'][size_name]
+        except KeyError:
+            resized = {}
+        if resized.get('size') == stat.st_size and \
+                resized.get('mtime') == stat.st_mtime_ns and 'hash' in resized:
+            return resized['hash']
+        return file_hash(path)
+
+    def record_resized(self, key, size_name, stat, dimensions,
+                       content_hash=None):
+        """Record dimensions of the resized image with its file `stat` and
+        optionally its content hash."""
+        entry = self._photos[key].setdefault('resized', {})
+        resized = {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'dimensions': list(dimensions),
+        }
+        if content_hash is not None:
+            resized['hash'] = content_hash
+        previous = entry.get(size_name, {})
+        if 'placeholder' in previous and _same_file(previous, stat):
+            resized['placeholder'] = previous['placeholder']
+        if entry.get(size_name) != resized:
+            entry[size_name] = resized
+            self._changed(key)
+
+    def resized_placeholder(self, key, size_name, stat):
+        """Return recorded placeholder of the resized image, or None if it is
+        not known or the file changed (according to its `stat`)."""
+        try:
+            resized = self._photos[key]['resized'][size_name]
+        except KeyError:
+            return None
+        if _same_file(resized, stat):
+            return resized.get('placeholder')
+        return None
+
+    def record_placeholder(self, key, size_name, placeholder):
+        """Record placeholder of the resized image recorded before."""
+        resized = self._photos[key]['resized'][size_name]
+        if resized.get('placeholder') != placeholder:
+            resized['placeholder'] = placeholder
+            self._changed(key)
+
+    def is_page_current(self, page_path, key):
+        """Check if the page exists and was rendered from the same inputs."""
+        name = os.path.relpath(page_path, os.path.dirname(self.path))
+        return self._pages.get(name) == key and os.path.exists(page_path)
+
+    def record_page(self, page_path, key):
+        name = os.path.relpath(page_path, os.path.dirname(self.path))
+        if self._pages.get(name) != key:
+            self._pages[name] = key
+            self._changed(name)
+
+    def compressed_copies(self):
+        """Paths of compressed copies relative to the output directory."""
+        return set(self._compressed)
+
+    def record_compressed(self, paths):
+        paths = sorted(paths)
+        if self._compressed != paths:
+            self._compressed = paths
+            self._modified = True
+
+    def page_paths(self):
+        """Paths of all recorded pages."""
+        return [os.path.join(os.path.dirname(self.path), name)
+                for name in self._pages]
+
+    def forget_page(self, page_path):
+        name = os.path.relpath(page_path, os.path.dirname(self.path))
+        if self._pages.pop(name, None) is not None:
+            self._changed(name)
+
+
+def _same_file(resized, stat):
+    return resized.get('size') == stat.st_size and \
+        resized.get('mtime') == stat.st_mtime_ns
+
+
+def _album_name(name):
+    """Album of the photo key or page path, or None for gallery pages."""
+    album, separator, _ = name.replace(os.sep, '/').partition('/')
+    return album if separator else None
+
+
+def _write_json(path, data):
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
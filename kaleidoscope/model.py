@@ -3,7 +3,7 @@ from __future__ import annotations
 import datetime
 from dataclasses import dataclass
 from itertools import groupby
-from typing import Optional, List, Tuple, Iterable
+from typing import Optional, List, Tuple, Iterable, Callable, NamedTuple
 
 
 def group_albums_by_year(albums):
@@ -21,22 +21,40 @@ class Gallery:
         self.title = title
         self.author = author
         self.albums = sorted(albums, key=lambda a: a.date, reverse=True)
-        self.albums_by_year = group_albums_by_year(self.albums)
+
+    @property
+    def albums_by_year(self):
+        return group_albums_by_year(self.albums)
 
 
-@dataclass
 class Album:
     """
     Album information
     - name -- identifier of the album, equal with its folder name
     - title -- displayed title of the album
     - date -- datetime.date for ordering albums in time
-    - photos -- ordered list of photos
+    - sections -- list of sections with photos
+    - loader -- optional function loading sections when they are accessed
+
+    Albums with a loader can release their sections to save memory, they
+    are loaded again when needed.
     """
-    name: str
-    title: str
-    date: datetime.date
-    sections: List[Section]
+    __slots__ = ('name', 'title', 'date', '_sections', 'loader')
+
+    def __init__(self, name: str, title: str, date: datetime.date,
+                 sections: Optional[List[Section]] = None,
+                 loader: Optional[Callable[[], List[Section]]] = None):
+        self.name = name
+        self.title = title
+        self.date = date
+        self._sections = sections
+        self.loader = loader
+
+    @property
+    def sections(self) -> List[Section]:
+        if self._sections is None:
+            self._sections = self.loader() if self.loader else []
+        return self._sections
 
     @property
     def photos(self) -> Iterable[Photo]:
@@ -44,6 +62,21 @@ class Album:
             for photo in section.photos:
                 yield photo
 
+    def release(self):
+        """Release loaded sections, if they can be loaded again."""
+        if self.loader is not None:
+            self._sections = None
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.name, self.title, self.date, self.sections) == \
+            (other.name, other.title, other.date, other.sections)
+
+    def __repr__(self):
+        return "Album(name={!r}, title={!r}, date={!r}, sections={!r})" \
+            .format(self.name, self.title, self.date, self.sections)
+
 
 @dataclass
 class Section:
@@ -55,7 +88,6 @@ class Section:
         return self.name == 'photos'
 
 
-@dataclass
 class Photo:
     """
     Photo information
@@ -63,17 +95,66 @@ class Photo:
     - short_caption
     - long_caption
     - source_path -- path to the source photo
+    - large, thumb -- resized images, filled by the generator
+    - placeholder -- CSS colour shown before the thumbnail is loaded, filled
+      by the generator
+    - metadata -- PhotoMetadata read from the source, filled by the generator
     """
-    name: str
-    short_caption: str
-    long_caption: str
-    source_path: str
-    large: Optional[ResizedImage] = None
-    thumb: Optional[ResizedImage] = None
+    __slots__ = ('name', 'short_caption', 'long_caption', 'source_path',
+                 'large', 'thumb', 'placeholder', 'metadata')
 
+    def __init__(self, name: str, short_caption: str, long_caption: str,
+                 source_path: str, large: Optional[ResizedImage] = None,
+                 thumb: Optional[ResizedImage] = None,
+                 placeholder: Optional[str] = None,
+                 metadata: Optional[PhotoMetadata] = None):
+        self.name = name
+        self.short_caption = short_caption
+        self.long_caption = long_caption
+        self.source_path = source_path
+        self.large = large
+        self.thumb = thumb
+        self.placeholder = placeholder
+        self.metadata = metadata
 
-@dataclass
-class ResizedImage:
-    """Resized image information: URL and size."""
+    def _fields(self):
+        return tuple(getattr(self, field) for field in self.__slots__)
+
+    def __eq__(self, other):
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __repr__(self):
+        return "Photo({})".format(", ".join(
+            "{}={!r}".format(field, getattr(self, field))
+            for field in self.__slots__))
+
+
+class ResizedImage(NamedTuple):
+    """
+    Resized image information
+    - url
+    - size -- width and height
+    - sources -- the same image in other formats, as pairs of MIME type and
+      URL, in order of preference
+    - variants -- the same image in other resolutions
+    """
     url: str
     size: Tuple[int, int]
+    sources: Tuple[Tuple[str, str], ...] = ()
+    variants: Tuple[ResizedImage, ...] = ()
+
+
+class PhotoMetadata(NamedTuple):
+    """
+    Metadata of the source photo
+    - taken -- datetime.datetime when the photo was taken, if known
+    - camera -- make and model of the camera, if known
+    - orientation -- EXIF orientation, 1 is upright
+    - size -- width and height of the photo as displayed, if known
+    """
+    taken: Optional[datetime.datetime]
+    camera: Optional[str]
+    orientation: int
+    size: Optional[Tuple[int, int]]
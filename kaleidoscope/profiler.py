@@ -0,0 +1,64 @@
+import heapq
+import itertools
+import json
+import time
+
+from kaleidoscope.generator import DefaultListener
+
+
+class Profiler(DefaultListener):
+    """Collects durations of build stages reported by the generator.
+
+    Wall and CPU times are summed per stage and per album. Resizing stage is
+    measured for each photo and the slowest photos are kept.
+    """
+    def __init__(self, slowest_photos=20):
+        self.slowest_photos = slowest_photos
+        self._start = time.perf_counter()
+        self._stages = {}
+        self._albums = {}
+        self._photos = []  # heap of (wall time, counter, photo record)
+        self._counter = itertools.count()
+
+    def stage_finished(self, stage, album, wall_time, cpu_time):
+        _add(self._stages, stage, wall_time, cpu_time)
+        if album is not None:
+            album_stages = self._albums.setdefault(album.name, {})
+            _add(album_stages, stage, wall_time, cpu_time)
+
+    def photo_resized(self, album, photo, wall_time, cpu_time):
+        self.stage_finished('resize', album, wall_time, cpu_time)
+        record = {
+            'album': album.name,
+            'photo': photo.name,
+            'source': photo.source_path,
+            'wall': wall_time,
+            'cpu': cpu_time,
+        }
+        item = (wall_time, next(self._counter), record)
+        if len(self._photos) < self.slowest_photos:
+            heapq.heappush(self._photos, item)
+        else:
+            heapq.heappushpop(self._photos, item)
+
+    def report(self):
+        """Return collected data as a dictionary."""
+        slowest = sorted(self._photos, key=lambda item: item[0], reverse=True)
+        return {
+            'wall': time.perf_counter() - self._start,
+            'stages': self._stages,
+            'albums': self._albums,
+            'slowest_photos': [record for _, _, record in slowest],
+        }
+
+    def write(self, path):
+        """Write collected data as JSON into the file."""
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def _add(stages, stage, wall_time, cpu_time):
+    totals = stages.setdefault(stage, {'wall': 0.0, 'cpu': 0.0, 'count': 0})
+    totals['wall'] += wall_time
+    totals['cpu'] += cpu_time
+    totals['count'] += 1
@@ -1,39 +1,145 @@
 import datetime
+import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List
 
-from kaleidoscope.config import GalleryConfigParser
+from kaleidoscope.config import GalleryConfigParser, BuildConfig
 from kaleidoscope.model import Gallery, Album, Section, Photo
 
 GALLERY_CONFIG = 'gallery.ini'
 ALBUM_CONFIG = 'album.ini'
+ALBUM_CACHE_NAME = '.kaleidoscope-albums'
+IMAGE_FORMATS = ('avif', 'webp')
 
 
-def read_gallery(path):
-    """Read gallery metadata from its source directory."""
+def read_gallery(path, cache=None):
+    """Read gallery metadata from its source directory.
+
+    Albums are read in parallel. Only album titles and dates are kept in
+    memory, sections with photos are loaded again when accessed (see
+    Album.release). If an AlbumCache is provided, albums which did not
+    change since they were cached are not parsed again.
+    """
     config = GalleryConfigParser()
     config.read(os.path.join(path, GALLERY_CONFIG))
     title = config.get('gallery', 'title') or "Photo Gallery"
     author = config.get('gallery', 'author')
-    albums = []
-    for child in os.listdir(path):
-        child_path = os.path.join(path, child)
-        if is_album(child_path):
-            albums.append(read_album(child_path))
+    album_dirs = [entry for entry in os.scandir(path) if entry.is_dir()]
+    with ThreadPoolExecutor() as pool:
+        albums = [album for album in
+                  pool.map(lambda d: _read_album_dir(d, cache), album_dirs)
+                  if album is not None]
+    if cache is not None:
+        cache.save()
     return Gallery(title, author, albums)
 
 
+def _read_album_dir(entry, cache) -> Optional[Album]:
+    """Read album from the directory, if it is an album."""
+    try:
+        config_stat = os.stat(os.path.join(entry.path, ALBUM_CONFIG))
+    except FileNotFoundError:
+        return None
+    dir_stat = entry.stat()
+    key = [config_stat.st_mtime_ns, config_stat.st_size, dir_stat.st_mtime_ns]
+    album = cache.get(entry.path, key) if cache is not None else None
+    if album is None:
+        album = _read_album(entry.path, dir_stat.st_mtime)
+        if cache is not None:
+            cache.put(entry.path, key, album)
+        else:
+            album.loader = lambda: _read_album_sections(entry.path)
+        album.release()
+    return album
+
+
+def read_build_config(path) -> BuildConfig:
+    """Read build settings from `[build]` section of the gallery config."""
+    config = GalleryConfigParser()
+    config.read(os.path.join(path, GALLERY_CONFIG))
+    if not config.has_section('build'):
+        return BuildConfig()
+    section = config['build']
+    defaults = BuildConfig()
+    return BuildConfig(
+        jobs=section.getint('jobs', defaults.jobs),
+        resize_backend=section.get('resize-backend', defaults.resize_backend),
+        content_hash=section.getboolean('content-hash', defaults.content_hash),
+        formats=parse_formats(section.get('formats', '')),
+        thumb_sizes=parse_sizes(section.get('thumb-sizes'),
+                                defaults.thumb_sizes),
+        large_sizes=parse_sizes(section.get('large-sizes'),
+                                defaults.large_sizes),
+        compress=_parse_names(section.get('compress', '')),
+        fingerprint=section.getboolean('fingerprint', defaults.fingerprint),
+        year_pages=section.getboolean('year-pages', defaults.year_pages),
+        album_covers=section.getboolean('album-covers',
+                                        defaults.album_covers),
+        chunk_size=section.getint('chunk-size', defaults.chunk_size),
+        placeholders=section.getboolean('placeholders',
+                                        defaults.placeholders),
+        pixel_budget=section.getfloat('pixel-budget', defaults.pixel_budget),
+        dedupe=section.getboolean('dedupe', defaults.dedupe),
+        staging=section.getboolean('staging', defaults.staging),
+    )
+
+
+def parse_formats(value):
+    """Parse list of image formats separated by whitespace or commas."""
+    formats = _parse_names(value)
+    for name in formats:
+        if name not in IMAGE_FORMATS:
+            raise ValueError("Unknown image format: " + name)
+    return formats
+
+
+def _parse_names(value):
+    return tuple(value.replace(',', ' ').lower().split())
+
+
+def parse_sizes(value, default):
+    """Parse list of geometries like '330x220 660x440'.
+
+    Widths of the geometries must be unique, as they identify the sizes.
+    """
+    if not value:
+        return default
+    sizes = []
+    for geometry in value.replace(',', ' ').split():
+        try:
+            width, height = (int(n) for n in geometry.lower().split('x'))
+        except ValueError:
+            raise ValueError("Invalid image size: " + geometry) from None
+        if width <= 0 or height <= 0:
+            raise ValueError("Invalid image size: " + geometry)
+        if any(width == w for w, h in sizes):
+            raise ValueError("Duplicate image width: " + geometry)
+        sizes.append((width, height))
+    return tuple(sizes)
+
+
 def read_album(path: str) -> Album:
+    return _read_album(path)
+
+
+def _read_album(path: str, dir_mtime: Optional[float] = None) -> Album:
     name = os.path.basename(path)
     config = GalleryConfigParser()
     config.read(os.path.join(path, ALBUM_CONFIG))
-    title, date = _read_album_info(path, config)
+    title, date = _read_album_info(path, config, dir_mtime)
+    return Album(name, title, date, _read_config_sections(config, path))
+
+
+def _read_album_sections(path: str) -> List[Section]:
+    config = GalleryConfigParser()
+    config.read(os.path.join(path, ALBUM_CONFIG))
+    return _read_config_sections(config, path)
 
-    sections = []
-    for section_name in config.sections():
-        if section_name != 'album':
-            sections.append(_read_sections(section_name, config, path))
 
-    return Album(name, title, date, sections)
+def _read_config_sections(config, path):
+    return [_read_sections(section_name, config, path)
+            for section_name in config.sections() if section_name != 'album']
 
 
 def _read_sections(name: str, config: GalleryConfigParser, path: str) -> Section:
@@ -46,7 +152,7 @@ def _read_sections(name: str, config: GalleryConfigParser, path: str) -> Section
     return Section(name, photos)
 
 
-def _read_album_info(path, config):
+def _read_album_info(path, config, dir_mtime=None):
     try:
         title = config['album']['title']
     except KeyError:
@@ -54,8 +160,9 @@ def _read_album_info(path, config):
     try:
         date = parse_date(config['album']['date'])
     except KeyError:
-        mtime = os.stat(path).st_mtime
-        date = datetime.date.fromtimestamp(mtime)
+        if dir_mtime is None:
+            dir_mtime = os.stat(path).st_mtime
+        date = datetime.date.fromtimestamp(dir_mtime)
     return title, date
 
 
@@ -73,3 +180,109 @@ def parse_date(date_string):
 
 def is_album(path):
     return os.path.exists(os.path.join(path, ALBUM_CONFIG))
+
+
+class AlbumCache:
+    """Cache of parsed albums stored in a directory.
+
+    Titles and dates of all albums are stored in an index file together with
+    a key describing the state of album directory and config file. Sections
+    of each album are stored in a separate file, so they can be loaded only
+    when the album is processed. Only albums used since the cache was loaded
+    are saved. Files are replaced atomically, so several processes (e.g.
+    shards of the build) can share the cache.
+    """
+    INDEX = 'index.json'
+
+    def __init__(self, path):
+        self.path = path
+        self._albums = {}
+        self._used = {}
+        self._modified = False
+
+    @classmethod
+    def load(cls, path):
+        cache = cls(path)
+        try:
+            with open(os.path.join(path, cls.INDEX)) as f:
+                cache._albums = json.load(f)
+        except (OSError, ValueError):
+            pass
+        return cache
+
+    def get(self, path, key) -> Optional[Album]:
+        """Get album read from the `path`, if it has the same key.
+
+        Sections of the album are loaded when accessed.
+        """
+        name = os.path.basename(path)
+        entry = self._albums.get(name)
+        if entry is None or entry['key'] != key:
+            return None
+        self._used[name] = entry
+        return Album(name, entry['title'], parse_date(entry['date']),
+                     loader=lambda: self._load_sections(path))
+
+    def put(self, path, key, album):
+        """Store the album and make it load its sections from the cache."""
+        name = os.path.basename(path)
+        os.makedirs(self.path, exist_ok=True)
+        _write_json(self._sections_path(name),
+                    _sections_to_json(album.sections))
+        self._used[name] = {
+            'key': key,
+            'title': album.title,
+            'date': album.date.isoformat(),
+        }
+        self._modified = True
+        album.loader = lambda: self._load_sections(path)
+
+    def save(self):
+        """Save index of used albums, if there was any change."""
+        if not self._modified and self._used.keys() == self._albums.keys():
+            return
+        os.makedirs(self.path, exist_ok=True)
+        for name in self._albums.keys() - self._used.keys():
+            try:
+                os.remove(self._sections_path(name))
+            except FileNotFoundError:
+                pass
+        _write_json(os.path.join(self.path, self.INDEX), self._used)
+        self._albums = self._used
+        self._used = {}
+        self._modified = False
+
+    def _load_sections(self, path):
+        try:
+            with open(self._sections_path(os.path.basename(path))) as f:
+                return _sections_from_json(path, json.load(f))
+        except (OSError, ValueError):
+            return _read_album_sections(path)
+
+    def _sections_path(self, name):
+        return os.path.join(self.path, name + '.json')
+
+
+def _write_json(path, data):
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def _sections_to_json(sections):
+    return [
+        [section.name, [[p.name, p.short_caption, p.long_caption]
+                        for p in section.photos]]
+        for section in sections
+    ]
+
+
+def _sections_from_json(path, data):
+    return [
+        Section(section_name, [
+            Photo(name, short_caption, long_caption, os.path.join(path, name))
+            for name, short_caption, long_caption in photos
+        ])
+        for section_name, photos in data
+    ]
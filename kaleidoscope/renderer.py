@@ -1,4 +1,6 @@
+import hashlib
 import os
+from urllib.parse import quote
 
 from jinja2 import Environment, PackageLoader
 
@@ -7,12 +9,91 @@ def formatdate(value, fmt='%d. %B'):
     return value.strftime(fmt)
 
 
+def srcset(image, mime_type=None, prefix=''):
+    """Format `srcset` attribute listing all resolutions of the resized image,
+    optionally in an additional format given by its MIME type. URLs are
+    prefixed by `prefix` and percent-encoded, as spaces and commas in file
+    names would split candidates."""
+    candidates = {}
+    for variant in (image,) + image.variants:
+        url = variant.url
+        if mime_type is not None:
+            url = dict(variant.sources)[mime_type]
+        # Sizes not upscaled from small sources are the same image
+        candidates.setdefault(variant.size[0], url)
+    return ", ".join("{} {}w".format(quote(prefix + url, safe='/?='), width)
+                     for width, url in sorted(candidates.items()))
+
+
+def asset_url(path):
+    """URL of the asset, with version of its content if it is known."""
+    version = _asset_versions.get(path)
+    if version is None:
+        return path
+    return path + '?v=' + version
+
+
+def set_asset_versions(versions):
+    """Set versions of assets used in their URLs, by asset path."""
+    global _asset_versions
+    _asset_versions = dict(versions)
+
+
 def render(template_name, file_path, context):
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
     template = _env.get_template(template_name)
-    with open(file_path, 'w') as output:
-        output.write(template.render(context))
+    write_if_changed(file_path, template.render(context))
+
+
+def write_if_changed(file_path, content):
+    """Write text file, unless it already exists with the same content.
+
+    Unchanged files keep their modification time, so they are not copied
+    again by tools synchronizing the output. Changed files are replaced, not
+    rewritten, as they can be linked from another output. Returns True if
+    the file was written.
+    """
+    data = content.encode('utf-8')
+    try:
+        with open(file_path, 'rb') as existing:
+            if existing.read() == data:
+                return False
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = file_path + '.tmp'
+    with open(tmp_path, 'wb') as output:
+        output.write(data)
+    os.replace(tmp_path, file_path)
+    return True
+
+
+def inputs_key(template_name, inputs):
+    """Key identifying a page rendered from the template with given inputs.
+
+    Inputs are described by their `repr`. The key changes also when any of
+    the templates or versions of assets are changed.
+    """
+    digest = hashlib.sha1(_templates_digest().encode())
+    digest.update(repr(sorted(_asset_versions.items())).encode())
+    digest.update(template_name.encode())
+    digest.update(repr(inputs).encode())
+    return digest.hexdigest()
+
+
+def _templates_digest():
+    global _templates_hash
+    if _templates_hash is None:
+        digest = hashlib.sha1()
+        for name in sorted(_env.list_templates()):
+            source, _, _ = _env.loader.get_source(_env, name)
+            digest.update(name.encode())
+            digest.update(source.encode())
+        _templates_hash = digest.hexdigest()
+    return _templates_hash
 
 
 _env = Environment(loader=PackageLoader('kaleidoscope', 'templates'))
 _env.filters['formatdate'] = formatdate
+_env.filters['srcset'] = srcset
+_env.globals['asset_url'] = asset_url
+_templates_hash = None
+_asset_versions = {}  # type: dict
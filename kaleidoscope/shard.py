@@ -0,0 +1,77 @@
+"""Building the gallery in parts (shards).
+
+Each shard generates only its albums and saves the manifest under its own
+name, so shards can be built by separate processes or machines, into the
+same output or into separate ones. Outputs of shards are then combined by
+Generator.merge.
+"""
+import os
+import re
+import shutil
+import zlib
+from typing import NamedTuple
+
+from kaleidoscope.manifest import MANIFEST_NAME
+
+
+class Shard(NamedTuple):
+    """Part `number` (counted from 1) of `total` parts of the gallery.
+
+    Albums are assigned to shards by a hash of their names, so each shard
+    gets the same albums on any machine.
+    """
+    number: int
+    total: int
+
+    @classmethod
+    def parse(cls, value):
+        """Parse shard specification like '2/4'."""
+        try:
+            number, total = (int(n) for n in value.split('/'))
+        except ValueError:
+            raise ValueError("Invalid shard: " + value) from None
+        if not 1 <= number <= total:
+            raise ValueError("Invalid shard: " + value)
+        return cls(number, total)
+
+    @classmethod
+    def from_manifest_name(cls, name):
+        """Shard of the manifest file name, or None if it is not a manifest
+        of a shard."""
+        match = SHARD_MANIFEST_NAME.match(name)
+        if match is None:
+            return None
+        return cls(int(match.group(1)), int(match.group(2)))
+
+    def contains(self, album_name):
+        crc = zlib.crc32(album_name.encode('utf-8'))
+        return crc % self.total == self.number - 1
+
+    @property
+    def manifest_name(self):
+        return '{}.shard-{}-of-{}'.format(MANIFEST_NAME, self.number,
+                                          self.total)
+
+
+SHARD_MANIFEST_NAME = re.compile(
+    '^' + re.escape(MANIFEST_NAME) + r'\.shard-(\d+)-of-(\d+)$')
+
+
+def shard_manifests(output):
+    """Find manifests of shards in the output; yield their names and
+    shards."""
+    for name in sorted(os.listdir(output)):
+        shard = Shard.from_manifest_name(name)
+        if shard is not None:
+            yield name, shard
+
+
+def move_albums(source, target, shard):
+    """Move album directories of the shard from its output to the target."""
+    for entry in os.scandir(source):
+        if entry.is_dir() and shard.contains(entry.name) and \
+                not entry.name.startswith('.') and entry.name != 'assets':
+            target_path = os.path.join(target, entry.name)
+            if os.path.isdir(target_path):
+                shutil.rmtree(target_path)
+            shutil.move(entry.path, target_path)
@@ -0,0 +1,53 @@
+"""Atomic replacement of the gallery output.
+
+The gallery is generated in a staging copy of the output, which then
+replaces the output at once, so the web server never serves a partially
+written gallery.
+"""
+import os
+import shutil
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def staged_output(output):
+    """Provide a staging copy of the output, which replaces the output when
+    the context exits without an error.
+
+    The output is a symbolic link to a build directory next to it (an
+    existing output directory is converted on the first use). The staging
+    copy shares files with the current build by hard links and the
+    generator replaces files instead of rewriting them, so the current build
+    is not modified. When finished, the link is atomically switched to the
+    staging directory and the previous build is removed.
+    """
+    output = os.path.abspath(output)
+    if os.path.isdir(output) and not os.path.islink(output):
+        build_dir = _new_build_dir(output)
+        os.rename(output, build_dir)
+        os.symlink(os.path.basename(build_dir), output)
+    previous = os.path.realpath(output) if os.path.exists(output) else None
+    staging = output + '.staging'
+    if os.path.lexists(staging):
+        # Left by an interrupted build
+        shutil.rmtree(staging)
+    if previous is not None:
+        shutil.copytree(previous, staging, symlinks=True,
+                        copy_function=os.link)
+    else:
+        os.makedirs(staging)
+    yield staging
+    build_dir = _new_build_dir(output)
+    os.rename(staging, build_dir)
+    link = output + '.link'
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(build_dir), link)
+    os.replace(link, output)
+    if previous is not None:
+        shutil.rmtree(previous)
+
+
+def _new_build_dir(output):
+    return '{}.{}'.format(output, time.time_ns())
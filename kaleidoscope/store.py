@@ -0,0 +1,116 @@
+"""Content-addressed store of resized images.
+
+Resized images of a photo are stored in an entry identified by a hash of the
+source content and resize parameters, and hard-linked into album outputs.
+A photo included in several albums is therefore resized and stored only
+once. Entries are created in a temporary directory and renamed into place,
+so processes building shards of the gallery can share the store.
+
+The store is kept next to the output directory (see store_path), so it is
+not published with the gallery, but stays on the same file system.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+from kaleidoscope.manifest import file_hash
+
+STORE_SUFFIX = '.kaleidoscope-store'
+
+
+def store_path(output):
+    """Path of the store for the output directory."""
+    return os.path.normpath(os.path.abspath(output)) + STORE_SUFFIX
+
+
+class DerivativeStore:
+    """Store of resized images in the `path` directory, for given resize
+    parameters (as recorded in the manifest) and additional formats."""
+    def __init__(self, path, params, formats=()):
+        self.path = path
+        self._params = json.dumps([params, list(formats)], sort_keys=True)
+        self._lock = threading.Lock()
+        self._entry_locks = {}
+        self.modified = False
+
+    def key(self, source_path):
+        """Key of the entry for the source photo."""
+        digest = hashlib.sha1(file_hash(source_path).encode())
+        digest.update(self._params.encode())
+        # The extension determines format of resized images
+        digest.update(os.path.splitext(source_path)[1].encode())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def get(self, key, create):
+        """Return path of the entry and result of `create(path)` called to
+        fill a new entry, or None if the entry already exists.
+
+        The same entry is not created by several threads at once.
+        """
+        path = self.entry_path(key)
+        with self._lock:
+            lock = self._entry_locks.setdefault(key, threading.Lock())
+        with lock:
+            if os.path.isdir(path):
+                return path, None
+            tmp_path = '{}.{}-{}.tmp'.format(path, os.getpid(),
+                                             threading.get_ident())
+            os.makedirs(tmp_path)
+            try:
+                result = create(tmp_path)
+                os.rename(tmp_path, path)
+            except OSError:
+                if not os.path.isdir(path):
+                    raise
+                # Created by another process in the meantime
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            return path, result
+
+    def link(self, stored_path, target):
+        """Replace the target by a hard link to the stored file, or by its
+        copy if the file system does not support hard links."""
+        if not os.path.exists(stored_path):
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+        try:
+            os.link(stored_path, target)
+        except OSError:
+            shutil.copy2(stored_path, target)
+        self.modified = True
+
+    def collect(self):
+        """Remove entries not linked from any output and temporary
+        directories left by interrupted builds."""
+        collect(self.path)
+        self.modified = False
+
+
+def collect(path):
+    """Remove entries of the store in the `path` directory, which are not
+    linked from any output, and temporary directories."""
+    if not os.path.isdir(path):
+        return
+    for prefix in os.scandir(path):
+        if not prefix.is_dir():
+            continue
+        for entry in os.scandir(prefix.path):
+            if entry.name.endswith('.tmp') or not _is_linked(entry.path):
+                shutil.rmtree(entry.path)
+
+
+def _is_linked(path):
+    for directory, _, files in os.walk(path):
+        for name in files:
+            if os.stat(os.path.join(directory, name)).st_nlink > 1:
+                return True
+    return False
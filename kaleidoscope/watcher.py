@@ -0,0 +1,105 @@
+import configparser
+import os
+import time
+
+from kaleidoscope.generator import Generator
+from kaleidoscope.model import Gallery
+from kaleidoscope.reader import read_gallery, read_album, is_album, \
+    AlbumCache, GALLERY_CONFIG, ALBUM_CONFIG, ALBUM_CACHE_NAME
+
+
+class GalleryWatcher:
+    """Detects changes in the gallery source directory by polling.
+
+    The watcher keeps modification time and size of the gallery config and of
+    each album config together with modification time of album directories.
+    Adding or removing photos changes modification time of the album
+    directory and editing captions changes the album config.
+    """
+    def __init__(self, path, cache=None):
+        self.path = path
+        self.cache = cache
+        self._gallery_state = self._gallery_config_state()
+        self._albums_state = self._scan_albums()
+
+    def poll(self):
+        """Check for changes since the previous poll.
+
+        Returns pair of a flag if the gallery config changed and a set of
+        names of added, changed or removed albums.
+        """
+        gallery_state = self._gallery_config_state()
+        albums_state = self._scan_albums()
+        gallery_changed = gallery_state != self._gallery_state
+        changed_albums = {
+            name for name in albums_state.keys() | self._albums_state.keys()
+            if albums_state.get(name) != self._albums_state.get(name)
+        }
+        self._gallery_state = gallery_state
+        self._albums_state = albums_state
+        return gallery_changed, changed_albums
+
+    def update(self, gallery):
+        """Apply changes since the previous poll to the gallery.
+
+        Only changed albums are read again. Returns the updated gallery with
+        a list of albums that need to be generated, or None if nothing
+        changed.
+        """
+        gallery_changed, changed_names = self.poll()
+        if gallery_changed:
+            gallery = read_gallery(self.path, self.cache)
+            return gallery, gallery.albums
+        if not changed_names:
+            return None
+        albums = [a for a in gallery.albums if a.name not in changed_names]
+        changed = []
+        for name in sorted(changed_names):
+            album_path = os.path.join(self.path, name)
+            if is_album(album_path):
+                album = read_album(album_path)
+                albums.append(album)
+                changed.append(album)
+        return Gallery(gallery.title, gallery.author, albums), changed
+
+    def _gallery_config_state(self):
+        try:
+            stat = os.stat(os.path.join(self.path, GALLERY_CONFIG))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _scan_albums(self):
+        state = {}
+        for entry in os.scandir(self.path):
+            if not entry.is_dir():
+                continue
+            try:
+                config = os.stat(os.path.join(entry.path, ALBUM_CONFIG))
+            except FileNotFoundError:
+                continue
+            state[entry.name] = (entry.stat().st_mtime_ns,
+                                 config.st_mtime_ns, config.st_size)
+        return state
+
+
+def watch(path, output, listener, config, interval=1.0):
+    """Build the gallery and rebuild changed albums until interrupted.
+
+    The gallery model, the manifest and loaded templates are kept in memory
+    between builds.
+    """
+    cache = AlbumCache.load(os.path.join(output, ALBUM_CACHE_NAME))
+    watcher = GalleryWatcher(path, cache)
+    gallery = read_gallery(path, cache)
+    generator = Generator(output, listener, config)
+    generator.generate(gallery)
+    while True:
+        time.sleep(interval)
+        try:
+            update = watcher.update(gallery)
+            if update is not None:
+                gallery, albums = update
+                generator.generate(gallery, albums)
+        except (configparser.Error, ValueError, OSError) as e:
+            print("Build failed: " + str(e))
@@ -0,0 +1,108 @@
+import os
+from unittest.mock import MagicMock
+
+import pytest
+
+from kaleidoscope import backends
+
+PHOTO_PATH = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+
+
+def test_get_backend():
+    assert isinstance(backends.get_backend('convert'), backends.ConvertBackend)
+
+
+def test_get_unknown_backend():
+    with pytest.raises(ValueError):
+        backends.get_backend('unknown')
+
+
+def test_pillow_resize(tmpdir):
+    """Pillow backend should write all outputs and report their sizes."""
+    Image = pytest.importorskip('PIL.Image')
+    large = str(tmpdir.join('large.jpg'))
+    thumb = str(tmpdir.join('thumb.jpg'))
+    backend = backends.get_backend('pillow')
+    sizes = backend.resize(PHOTO_PATH, [((1500, 1000), [large]),
+                                        ((330, 220), [thumb])])
+    assert sizes == [(1333, 1000), (293, 220)]
+    assert Image.open(large).size == (1333, 1000)
+    assert Image.open(thumb).size == (293, 220)
+
+
+def test_pillow_additional_formats(tmpdir):
+    """Pillow backend should write each output in formats of all targets."""
+    Image = pytest.importorskip('PIL.Image')
+    backend = backends.get_backend('pillow')
+    if 'webp' not in backend.supported_formats():
+        pytest.skip("Pillow without WebP support")
+    thumb = str(tmpdir.join('thumb.jpg'))
+    thumb_webp = str(tmpdir.join('thumb.jpg.webp'))
+    sizes = backend.resize(PHOTO_PATH, [((330, 220), [thumb, thumb_webp])])
+    assert sizes == [(293, 220)]
+    assert Image.open(thumb).format == 'JPEG'
+    with Image.open(thumb_webp) as image:
+        assert image.format == 'WEBP'
+        assert image.size == (293, 220)
+
+
+def test_pillow_intermediate_size(tmpdir):
+    """Outputs without target are computed, but not written."""
+    pytest.importorskip('PIL')
+    thumb = str(tmpdir.join('thumb.jpg'))
+    backend = backends.get_backend('pillow')
+    sizes = backend.resize(PHOTO_PATH, [((1500, 1000), []),
+                                        ((330, 220), [thumb])])
+    assert sizes == [(293, 220)]
+    assert os.listdir(str(tmpdir)) == ['thumb.jpg']
+
+
+def test_pillow_auto_orient(tmpdir):
+    """Pillow backend should apply EXIF orientation."""
+    Image = pytest.importorskip('PIL.Image')
+    source = str(tmpdir.join('rotated.jpg'))
+    with Image.open(PHOTO_PATH) as image:
+        exif = image.getexif()
+        exif[backends.ORIENTATION_TAG] = 6
+        image.save(source, exif=exif)
+    thumb = str(tmpdir.join('thumb.jpg'))
+    sizes = backends.get_backend('pillow').resize(
+        source, [((330, 220), [thumb])])
+    assert sizes == [(165, 220)]
+
+
+def test_pillow_placeholder(tmpdir):
+    Image = pytest.importorskip('PIL.Image')
+    path = str(tmpdir.join('red.png'))
+    Image.new('RGB', (4, 4), (255, 0, 0)).save(path)
+    assert backends.get_backend('pillow').placeholder(path) == '#ff0000'
+
+
+def test_pillow_resize_placeholder(tmpdir):
+    """Placeholder should be computed from the smallest written output."""
+    Image = pytest.importorskip('PIL.Image')
+    source = str(tmpdir.join('red.png'))
+    Image.new('RGB', (400, 400), (255, 0, 0)).save(source)
+    thumb = str(tmpdir.join('thumb.png'))
+    sizes, colour = backends.get_backend('pillow').resize(
+        source, [((100, 100), [thumb])], placeholder=True)
+    assert sizes == [(100, 100)]
+    assert colour == '#ff0000'
+
+
+def test_convert_resize_placeholder(monkeypatch):
+    """Convert backend should print the placeholder from the resize
+    command, without running another one."""
+    run_mock = MagicMock()
+    run_mock.return_value.returncode = 0
+    run_mock.return_value.stdout = '255,0,0'
+    monkeypatch.setattr(backends.subprocess, 'run', run_mock)
+    sizes, colour = backends.ConvertBackend().resize(
+        PHOTO_PATH, [((1500, 1000), ['large.jpg']), ((330, 220), [])],
+        placeholder=True)
+    assert sizes == [None]
+    assert colour == '#ff0000'
+    assert run_mock.call_count == 1
+    command = run_mock.call_args[0][0]
+    assert command[-1] == 'large.jpg'
+    assert command[command.index('+clone') + 1:][:2] == ['-resize', '1x1!']
@@ -0,0 +1,103 @@
+import gzip
+import os
+
+import pytest
+
+from kaleidoscope import compress
+from kaleidoscope.config import BuildConfig
+from kaleidoscope.generator import generate
+from kaleidoscope.model import Gallery
+
+
+def test_compress_output(tmpdir):
+    """Text files should get compressed copies with the same content."""
+    tmpdir.join("index.html").write("<html></html>")
+    tmpdir.join("album", "large", "photo.jpg").ensure()
+    copies, written = compress.compress_output(
+        str(tmpdir), compress.get_compressors(['gzip']))
+    assert copies == {"index.html.gz"}
+    assert written == 1
+    with gzip.open(str(tmpdir.join("index.html.gz"))) as f:
+        assert f.read() == b"<html></html>"
+    assert not tmpdir.join("album", "large", "photo.jpg.gz").exists()
+
+
+def test_only_changed_files_compressed(tmpdir):
+    page = tmpdir.join("index.html")
+    page.write("<html></html>")
+    compressors = compress.get_compressors(['gzip'])
+    compress.compress_output(str(tmpdir), compressors)
+    assert compress.compress_output(str(tmpdir), compressors)[1] == 0
+
+    page.write("<html>changed</html>")
+    os.utime(str(page), ns=(0, 1))
+    assert compress.compress_output(str(tmpdir), compressors)[1] == 1
+    with gzip.open(str(tmpdir.join("index.html.gz"))) as f:
+        assert f.read() == b"<html>changed</html>"
+
+
+def test_resized_images_skipped(tmpdir):
+    """Directories of resized images should not be searched, unlike the
+    assets directory."""
+    tmpdir.join("album", "index.html").write("<html></html>", ensure=True)
+    tmpdir.join("album", "thumb", "photo.svg").write("<svg/>", ensure=True)
+    tmpdir.join("assets", "js", "app.js").write("app()", ensure=True)
+    copies, _ = compress.compress_output(str(tmpdir),
+                                         compress.get_compressors(['gzip']))
+    assert copies == {os.path.join("album", "index.html.gz"),
+                      os.path.join("assets", "js", "app.js.gz")}
+
+
+def test_compressed_copy_of_removed_file_deleted(tmpdir):
+    page = tmpdir.join("index.html")
+    page.write("<html></html>")
+    compressors = compress.get_compressors(['gzip'])
+    copies, _ = compress.compress_output(str(tmpdir), compressors)
+    page.remove()
+    compress.compress_output(str(tmpdir), compressors, previous=copies)
+    assert not tmpdir.join("index.html.gz").exists()
+
+
+def test_disabled_compression_deleted(tmpdir):
+    """Compressed copies by methods no longer used should be deleted."""
+    tmpdir.join("index.html").write("<html></html>")
+    copies, _ = compress.compress_output(str(tmpdir),
+                                         compress.get_compressors(['gzip']))
+    assert tmpdir.join("index.html.gz").exists()
+    compress.compress_output(str(tmpdir), {}, previous=copies)
+    assert not tmpdir.join("index.html.gz").exists()
+
+
+def test_other_compressed_files_kept(tmpdir):
+    """Compressed files not written by Kaleidoscope should be kept."""
+    tmpdir.join("notes.txt.gz").write("user's file")
+    compress.compress_output(str(tmpdir), {})
+    compress.compress_output(str(tmpdir), compress.get_compressors(['gzip']))
+    assert tmpdir.join("notes.txt.gz").read() == "user's file"
+
+
+def test_unknown_compression():
+    with pytest.raises(ValueError):
+        compress.get_compressors(['zip'])
+
+
+def test_generate_compressed(tmpdir):
+    """Compressed copies of assets should be kept when assets are synced."""
+    gallery = Gallery("", "", [])
+    config = BuildConfig(compress=('gzip',))
+    generate(gallery, str(tmpdir), config=config)
+    assets_js = tmpdir.join("assets", "kaleidoscope.js.gz")
+    assert tmpdir.join("index.html.gz").exists()
+    assert assets_js.exists()
+    mtime = assets_js.mtime()
+
+    generate(gallery, str(tmpdir), config=config)
+    assert assets_js.mtime() == mtime
+
+    # A build without compression removes only copies written before
+    own_copy = tmpdir.join("index.html.br")
+    own_copy.write("written by the user")
+    generate(gallery, str(tmpdir))
+    assert not assets_js.exists()
+    assert not tmpdir.join("index.html.gz").exists()
+    assert own_copy.exists()
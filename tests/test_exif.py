@@ -0,0 +1,52 @@
+import datetime
+import os
+
+import pytest
+
+from kaleidoscope.exif import read_metadata, metadata_to_json, \
+    metadata_from_json
+from kaleidoscope.model import PhotoMetadata
+
+
+def _photo_with_exif(path, orientation):
+    Image = pytest.importorskip('PIL.Image')
+    exif = Image.Exif()
+    exif[0x010F] = "Canon"
+    exif[0x0110] = "Canon EOS 5D"
+    exif[0x0112] = orientation
+    exif[0x0132] = "2020:01:02 00:00:00"
+    exif.get_ifd(0x8769)[0x9003] = "2019:12:31 23:59:58"
+    Image.new('RGB', (40, 30)).save(path, exif=exif)
+
+
+def test_read_metadata(tmpdir):
+    path = str(tmpdir.join("photo.jpg"))
+    _photo_with_exif(path, 1)
+    assert read_metadata(path) == PhotoMetadata(
+        datetime.datetime(2019, 12, 31, 23, 59, 58), "Canon EOS 5D", 1,
+        (40, 30))
+
+
+def test_read_metadata_rotated(tmpdir):
+    path = str(tmpdir.join("photo.jpg"))
+    _photo_with_exif(path, 6)
+    metadata = read_metadata(path)
+    assert metadata.orientation == 6
+    assert metadata.size == (30, 40)
+
+
+def test_read_metadata_without_exif():
+    path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    assert read_metadata(path) == PhotoMetadata(None, None, 1, (2000, 1500))
+
+
+def test_invalid_file(tmpdir):
+    path = tmpdir.join("photo.jpg")
+    path.write_binary(b'\xff\xd8\xff\xe1\x00\x10Exif\0\0MM\0*\xff\xff')
+    assert read_metadata(str(path)) == PhotoMetadata(None, None, 1, None)
+
+
+def test_metadata_json():
+    metadata = PhotoMetadata(datetime.datetime(2019, 12, 31, 23, 59, 58),
+                             "Canon EOS 5D", 6, (30, 40))
+    assert metadata_from_json(metadata_to_json(metadata)) == metadata
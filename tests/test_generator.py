@@ -1,13 +1,19 @@
+import json
 import os
+import threading
+import time
 from datetime import date
-from unittest.mock import MagicMock, call
+from unittest.mock import ANY, MagicMock, call
 
 import pytest
 import imagesize
 
-from kaleidoscope import renderer, generator
+from kaleidoscope import renderer, generator, backends, store
+from kaleidoscope.config import BuildConfig
 from kaleidoscope.model import Gallery, Album, Section, Photo
 from kaleidoscope.generator import generate, DefaultListener
+from kaleidoscope.manifest import file_hash
+from kaleidoscope.shard import Shard
 
 
 def test_generate_gallery_index(tmpdir, disable_resize):
@@ -32,12 +38,198 @@ def test_gallery_index_context(tmpdir, monkeypatch, disable_resize):
     )
 
 
+def test_year_pages(tmpdir, disable_resize):
+    """With year pages, albums of each year are listed on its own page and
+    adding an album changes only page of its year."""
+    config = BuildConfig(year_pages=True, album_covers=True)
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    albums = [
+        Album("a2019", "Old", date(2019, 5, 1), [
+            Section("photos", [Photo("photo.jpg", "", "", photo_path)])]),
+        Album("a2020", "New", date(2020, 5, 1), []),
+    ]
+    generate(Gallery("Gallery", "Tester", albums), str(tmpdir), config=config)
+    page_2019 = tmpdir.join("2019.html")
+    assert 'href="a2019"' in page_2019.read()
+    assert 'src="a2019/thumb/photo.jpg"' in page_2019.read()
+    assert 'href="2020.html"' in tmpdir.join("index.html").read()
+    mtime_2020 = tmpdir.join("2020.html").mtime()
+
+    albums.append(Album("b2019", "Also old", date(2019, 1, 1), []))
+    generate(Gallery("Gallery", "Tester", albums), str(tmpdir), config=config)
+    assert 'href="b2019"' in page_2019.read()
+    assert tmpdir.join("2020.html").mtime() == mtime_2020
+
+    not_generated = tmpdir.join("404.html")
+    not_generated.write("Not found")
+    generate(Gallery("Gallery", "Tester", albums), str(tmpdir))
+    assert not page_2019.exists()
+    assert not_generated.exists()
+
+
 def test_album_index_generated(tmpdir, gallery_with_one_photo, disable_resize):
     """Generator should create album index file."""
     generate(gallery_with_one_photo, str(tmpdir))
     assert tmpdir.join("album", "index.html").exists()
 
 
+def test_chunked_album_page(tmpdir, disable_resize):
+    """With chunk size, only first photos are in the page and all photos
+    are listed in the JSON file."""
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    album = Album("album", "The Album", date(2017, 6, 24), [
+        Section("photos", [Photo("a.jpg", "A", "A", photo_path),
+                           Photo("b.jpg", "B", "B", photo_path)]),
+        Section("later", [Photo("c.jpg", "C", "C long", photo_path)]),
+    ])
+    gallery = Gallery("Gallery", "Tester", [album])
+    generate(gallery, str(tmpdir), config=BuildConfig(chunk_size=1))
+
+    page = tmpdir.join("album", "index.html").read()
+    assert 'src="thumb/a.jpg"' in page
+    assert 'thumb/b.jpg' not in page
+    assert 'later' not in page
+    assert 'data-photos="photos.json"' in page
+    data = json.loads(tmpdir.join("album", "photos.json").read())
+    assert [s['name'] for s in data['sections']] == ["photos", "later"]
+    photo = data['sections'][1]['photos'][0]
+    assert photo['thumb']['url'] == "thumb/c.jpg"
+    assert photo['large']['size'] == [42, 42]
+    assert photo['description'] == "C long"
+
+    config = BuildConfig(chunk_size=1, fingerprint=True)
+    generate(gallery, str(tmpdir), config=config)
+    version = file_hash(str(tmpdir.join("album", "photos.json")))[:10]
+    assert 'data-photos="photos.json?v={}"'.format(version) in \
+        tmpdir.join("album", "index.html").read()
+
+    generate(gallery, str(tmpdir))
+    assert 'thumb/b.jpg' in tmpdir.join("album", "index.html").read()
+    assert not tmpdir.join("album", "photos.json").exists()
+
+
+def _two_albums_gallery():
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    # Names are chosen to be in different shards of two
+    return Gallery("Gallery", "Tester", [
+        Album(name, name.title(), date(2017, 6, 24), [Section("photos", [
+            Photo("photo.jpg", "", "", photo_path)])])
+        for name in ("album1", "album4")
+    ])
+
+
+def test_shards_merged(tmpdir, disable_resize):
+    """Shards built into the same output should generate only their albums
+    and the merge should generate the index."""
+    gallery = _two_albums_gallery()
+    output = str(tmpdir)
+    generate(gallery, output, shard=Shard(1, 2))
+    assert tmpdir.join("album4", "index.html").exists()
+    assert not tmpdir.join("album1", "index.html").exists()
+    assert not tmpdir.join("index.html").exists()
+    generate(gallery, output, shard=Shard(2, 2))
+    assert tmpdir.join("album1", "index.html").exists()
+
+    generator.Generator(output).merge(gallery)
+    assert 'href="album1"' in tmpdir.join("index.html").read()
+    assert not tmpdir.join(".kaleidoscope-cache.shard-1-of-2").exists()
+    manifest = generator.Manifest.load(output)
+    assert "album1/photo.jpg" in manifest
+    assert "album4/photo.jpg" in manifest
+
+
+def test_shards_merged_from_other_outputs(tmpdir, disable_resize):
+    gallery = _two_albums_gallery()
+    for index in (1, 2):
+        generate(gallery, str(tmpdir.join("shard{}".format(index))),
+                 shard=Shard(index, 2))
+    output = str(tmpdir.join("output"))
+    generator.Generator(output).merge(
+        gallery, [str(tmpdir.join("shard1")), str(tmpdir.join("shard2"))])
+    assert tmpdir.join("output", "album1", "index.html").exists()
+    assert tmpdir.join("output", "album4", "index.html").exists()
+    assert "album4/photo.jpg" in generator.Manifest.load(output)
+
+
+def test_removed_outputs_pruned(tmpdir, disable_resize):
+    """Outputs of removed albums, photos and sizes should be removed."""
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+
+    def gallery(*photo_names):
+        albums = [Album("album1", "Album", date(2017, 6, 24), [
+            Section("photos", [Photo(name, "", "", photo_path)
+                               for name in photo_names])])]
+        return Gallery("Gallery", "Tester", albums)
+    config = BuildConfig(thumb_sizes=((330, 220), (660, 440)))
+    generate(_two_albums_gallery(), str(tmpdir), config=config)
+    generate(gallery("photo.jpg", "removed.jpg"), str(tmpdir), config=config)
+    assert not tmpdir.join("album4").exists()
+    for name in ("photo.jpg", "removed.jpg", "unknown.jpg"):
+        tmpdir.join("album1", "thumb", name).ensure()
+    tmpdir.join("album1", "thumb-660", "photo.jpg").ensure()
+    tmpdir.join("robots.txt").ensure()
+
+    # Only outputs of the photo recorded in the manifest are removed
+    generate(gallery("photo.jpg"), str(tmpdir), config=config)
+    assert tmpdir.join("album1", "index.html").exists()
+    assert not tmpdir.join("album1", "thumb", "removed.jpg").exists()
+    assert tmpdir.join("album1", "thumb", "unknown.jpg").exists()
+    assert tmpdir.join("album1", "thumb-660", "photo.jpg").exists()
+
+    generate(gallery("photo.jpg"), str(tmpdir))
+    assert tmpdir.join("album1", "thumb").listdir() == \
+        [tmpdir.join("album1", "thumb", "photo.jpg")]
+    assert not tmpdir.join("album1", "thumb-660").exists()
+    assert tmpdir.join("robots.txt").exists()
+
+
+def test_staged_output(tmpdir, disable_resize):
+    """Staged build should replace the output by a link to the new build,
+    without modifying the previous one."""
+    output = tmpdir.join("output")
+    gallery = _two_albums_gallery()
+    generate(gallery, str(output))
+    config = BuildConfig(staging=True)
+    generate(gallery, str(output), config=config)
+    assert output.islink()
+    previous = output.realpath()
+    # Keep the previous page to check it is not rewritten
+    old_page = tmpdir.join("old.html")
+    os.link(str(previous.join("index.html")), str(old_page))
+
+    gallery.title = "Renamed Gallery"
+    generate(gallery, str(output), config=config)
+    assert output.realpath() != previous
+    assert not previous.exists()
+    assert "Renamed Gallery" in output.join("index.html").read()
+    assert "Renamed Gallery" not in old_page.read()
+    assert sorted(p.basename for p in tmpdir.listdir()) == \
+        sorted(["old.html", "output", output.realpath().basename])
+
+
+def test_staged_output_collects_store(tmpdir):
+    """Stored images of removed photos should be removed by a staged build,
+    although the previous build linked them."""
+    pytest.importorskip('PIL')
+    output = tmpdir.join("output")
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    album = Album("album", "Album", date(2017, 6, 24), [
+        Section("photos", [Photo("photo.jpg", "", "", photo_path)])])
+    config = BuildConfig(resize_backend='pillow', dedupe=True, staging=True)
+    generate(Gallery("Gallery", "The Tester", [album]), str(output),
+             config=config)
+    store_path = tmpdir.join("output" + store.STORE_SUFFIX)
+
+    def entries():
+        return [entry for prefix in store_path.listdir()
+                for entry in prefix.listdir()]
+    assert entries()
+    assert not output.join(store.STORE_SUFFIX).exists()
+
+    generate(Gallery("Gallery", "The Tester", []), str(output), config=config)
+    assert entries() == []
+
+
 def test_album_index_context(tmpdir, monkeypatch, disable_resize):
     """
     Generator should provide provide correct context to the album template.
@@ -86,6 +278,307 @@ def test_resize_existing(tmpdir, gallery_with_one_photo):
     assert large_path.mtime() == original_large_mtime
 
 
+def test_resize_decodes_source_once(tmpdir, monkeypatch,
+                                    gallery_with_one_photo):
+    """All sizes should be produced by a single convert invocation, deriving
+    the thumbnail from the large image."""
+    run_mock = MagicMock()
+    monkeypatch.setattr(backends.subprocess, 'run', run_mock)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    album_output = str(tmpdir.join("album"))
+    generator.resize(photo, album_output)
+
+    run_mock.assert_called_once_with([
+        'convert', photo.source_path, '-auto-orient',
+        '-resize', '1500x1000>',
+        '-write', str(tmpdir.join("album", "large", "photo.jpg")),
+        '-resize', '330x220>',
+        str(tmpdir.join("album", "thumb", "photo.jpg")),
+    ])
+
+
+def test_resize_only_missing_size(tmpdir, monkeypatch, gallery_with_one_photo):
+    """When only the thumbnail is missing, the large image is not rewritten."""
+    run_mock = MagicMock()
+    monkeypatch.setattr(backends.subprocess, 'run', run_mock)
+    tmpdir.join("album", "large", "photo.jpg").ensure()
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    generator.resize(photo, str(tmpdir.join("album")))
+
+    run_mock.assert_called_once_with([
+        'convert', photo.source_path, '-auto-orient',
+        '-resize', '1500x1000>', '-resize', '330x220>',
+        str(tmpdir.join("album", "thumb", "photo.jpg")),
+    ])
+
+
+def test_resize_additional_formats(tmpdir, monkeypatch,
+                                   gallery_with_one_photo):
+    """Additional formats should be written from the same resized image."""
+    run_mock = MagicMock()
+    monkeypatch.setattr(backends.subprocess, 'run', run_mock)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    generator.resize(photo, str(tmpdir.join("album")), formats=('webp',))
+
+    run_mock.assert_called_once_with([
+        'convert', photo.source_path, '-auto-orient',
+        '-resize', '1500x1000>',
+        '-write', str(tmpdir.join("album", "large", "photo.jpg")),
+        '-write', str(tmpdir.join("album", "large", "photo.jpg.webp")),
+        '-resize', '330x220>',
+        '-write', str(tmpdir.join("album", "thumb", "photo.jpg")),
+        str(tmpdir.join("album", "thumb", "photo.jpg.webp")),
+    ])
+
+
+def test_added_format_resized(tmpdir, monkeypatch, gallery_with_one_photo,
+                              disable_resize):
+    """Photos should be resized when a configured format is missing, and
+    the page should offer it to browsers."""
+    backend = generator.get_backend('convert')
+    monkeypatch.setattr(backend, 'supported_formats', lambda: {'webp'})
+    monkeypatch.setattr(generator, 'get_backend', lambda name: backend)
+    for size_name in generator.SIZES:
+        tmpdir.join("album", size_name, "photo.jpg").ensure()
+    generate(gallery_with_one_photo, str(tmpdir))
+    assert not generator.resize.called
+
+    config = BuildConfig(formats=('avif', 'webp'))
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    assert generator.resize.call_args[0][4] == ('webp',)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.thumb.sources == (('image/webp', 'thumb/photo.jpg.webp'),)
+    page = tmpdir.join("album", "index.html").read()
+    assert '<source type="image/webp" srcset="thumb/photo.jpg.webp 42w"' \
+        in page
+    assert 'data-large-srcset-webp="large/photo.jpg.webp 42w"' in page
+
+
+def test_resize_size_ladder(tmpdir, gallery_with_one_photo):
+    """All sizes of ladders should be written and offered in srcset."""
+    pytest.importorskip('PIL')
+    config = BuildConfig(resize_backend='pillow',
+                         thumb_sizes=((165, 110), (330, 220)),
+                         large_sizes=((1000, 1000), (500, 500)))
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    for name in ("thumb", "thumb-330", "large", "large-500"):
+        assert tmpdir.join("album", name, "photo.jpg").exists()
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.thumb.url == "thumb/photo.jpg"
+    assert [v.url for v in photo.thumb.variants] == ["thumb-330/photo.jpg"]
+    page = tmpdir.join("album", "index.html").read()
+    assert 'srcset="thumb/photo.jpg 146w, thumb-330/photo.jpg 293w"' in page
+    assert ('data-large-srcset="large-500/photo.jpg 500w, '
+            'large/photo.jpg 1000w"') in page
+
+
+def test_srcset_escaped(tmpdir, gallery_with_one_photo):
+    """URLs in srcset should be percent-encoded, so that commas and spaces
+    in file names do not split them."""
+    pytest.importorskip('PIL')
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    photo.name = "My Photo, 1.jpg"
+    config = BuildConfig(resize_backend='pillow', chunk_size=1)
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    escaped = 'thumb/My%20Photo%2C%201.jpg 293w'
+    assert 'srcset="{}"'.format(escaped) in \
+        tmpdir.join("album", "index.html").read()
+    photos = json.loads(tmpdir.join("album", "photos.json").read())
+    photo_data = photos['sections'][0]['photos'][0]
+    assert photo_data['thumb']['srcset'] == escaped
+
+
+def test_placeholders(tmpdir, monkeypatch, gallery_with_one_photo):
+    """Placeholders should be computed while resizing photos and then reused
+    while their thumbnails do not change."""
+    pytest.importorskip('PIL')
+    placeholder_mock = MagicMock()
+    monkeypatch.setattr(backends.PillowBackend, 'placeholder',
+                        placeholder_mock)
+    config = BuildConfig(resize_backend='pillow', placeholders=True)
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    assert not placeholder_mock.called
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.placeholder.startswith('#')
+    page = tmpdir.join("album", "index.html").read()
+    assert 'style="background-color: {}"'.format(photo.placeholder) in page
+
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    assert not placeholder_mock.called
+    assert photo.placeholder.startswith('#')
+
+
+def test_dedupe_shared_photos(tmpdir, monkeypatch):
+    """A photo included in several albums should be resized once and linked
+    into each album."""
+    pytest.importorskip('PIL')
+    resize_mock = MagicMock(wraps=generator.resize)
+    monkeypatch.setattr(generator, 'resize', resize_mock)
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    albums = [Album(name, name, date(2017, 6, 24), [Section("photos", [
+        Photo(photo_name, "", "", photo_path)])])
+        for name, photo_name in (("album1", "photo.jpg"),
+                                 ("album2", "best.jpg"))]
+    gallery = Gallery("Gallery", "The Tester", albums)
+    config = BuildConfig(resize_backend='pillow', dedupe=True)
+    output = tmpdir.join("output")
+    generate(gallery, str(output), config=config)
+
+    assert resize_mock.call_count == 1
+    for size_name in generator.SIZES:
+        assert os.path.samefile(
+            str(output.join("album1", size_name, "photo.jpg")),
+            str(output.join("album2", size_name, "best.jpg")))
+    assert tmpdir.join("output" + store.STORE_SUFFIX).isdir()
+    assert albums[1].sections[0].photos[0].thumb.size == \
+        albums[0].sections[0].photos[0].thumb.size
+
+
+def test_resize_shrink_on_load(tmpdir, monkeypatch, gallery_with_one_photo):
+    """Huge JPEG sources should be shrunk by the decoder."""
+    run_mock = MagicMock()
+    monkeypatch.setattr(backends.subprocess, 'run', run_mock)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    generator.resize(photo, str(tmpdir.join("album")),
+                     source_size=(16000, 12000))
+    command = run_mock.call_args[0][0]
+    assert command[:4] == ['convert', '-define', 'jpeg:size=4000x3000',
+                           photo.source_path]
+
+
+def test_pixel_budget(tmpdir, monkeypatch, disable_resize):
+    """Photos should not be resized at once if they exceed the budget."""
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    album = Album("album", "Album", date(2017, 6, 24), [Section("photos", [
+        Photo("photo{}.jpg".format(i), "", "", photo_path) for i in range(4)
+    ])])
+    lock = threading.Lock()
+    running = []
+    concurrent = []
+
+    def resize(photo, *args):
+        with lock:
+            running.append(photo)
+            concurrent.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(photo)
+        return {}
+    monkeypatch.setattr(generator, 'resize', resize)
+
+    # Each source has 42x42 pixels
+    config = BuildConfig(jobs=4, pixel_budget=0.002)
+    generate(Gallery("", "", [album]), str(tmpdir), config=config)
+    assert len(concurrent) == 4
+    assert max(concurrent) == 1
+
+
+def test_resize_sizes_from_backend(tmpdir, monkeypatch,
+                                   gallery_with_one_photo):
+    """Sizes reported by the backend should be used without reading the
+    resized files."""
+    backend = MagicMock()
+    backend.name, backend.version = 'mock', '1'
+    backend.resize.return_value = [(150, 100), (33, 22)]
+    monkeypatch.setattr(generator, 'get_backend', lambda name: backend)
+    get_mock = MagicMock()
+    monkeypatch.setattr(imagesize, 'get', get_mock)
+
+    generate(gallery_with_one_photo, str(tmpdir))
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.large.size == (150, 100)
+    assert photo.thumb.size == (33, 22)
+    assert not get_mock.called
+
+
+def test_resize_changed_source(tmpdir, gallery_with_one_photo,
+                               disable_resize):
+    """Photo should be resized again when its source changed since the
+    previous build."""
+    source = tmpdir.join("photo.jpg")
+    source.write("original")
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    photo.source_path = str(source)
+    output = tmpdir.join("output")
+    generate(gallery_with_one_photo, str(output))
+    output.join("album", "large", "photo.jpg").ensure()
+    output.join("album", "thumb", "photo.jpg").ensure()
+
+    generator.resize.reset_mock()
+    generate(gallery_with_one_photo, str(output))
+    assert not generator.resize.called
+
+    source.write("edited")
+    generate(gallery_with_one_photo, str(output))
+    assert generator.resize.call_args[0][3] == {'large', 'thumb'}
+
+
+def test_resize_changed_sizes(tmpdir, monkeypatch, gallery_with_one_photo,
+                              disable_resize):
+    """Photos should be resized again when resize parameters changed."""
+    tmpdir.join("album", "large", "photo.jpg").ensure()
+    tmpdir.join("album", "thumb", "photo.jpg").ensure()
+    generate(gallery_with_one_photo, str(tmpdir))
+    assert not generator.resize.called
+
+    config = BuildConfig(thumb_sizes=((200, 200),))
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    # Only thumbnails are created again
+    assert generator.resize.call_args[0][3] == {'thumb'}
+
+
+def test_resized_sizes_cached(tmpdir, monkeypatch, gallery_with_one_photo,
+                              disable_resize):
+    """Sizes of resized images should be read only when the files changed
+    since the previous build."""
+    large_path = tmpdir.join("album", "large", "photo.jpg")
+    large_path.ensure()
+    tmpdir.join("album", "thumb", "photo.jpg").ensure()
+    generate(gallery_with_one_photo, str(tmpdir))
+    assert imagesize.get.call_count == 2
+
+    imagesize.get.reset_mock()
+    generate(gallery_with_one_photo, str(tmpdir))
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert not imagesize.get.called
+    assert photo.large.size == (42, 42)
+
+    large_path.write("changed")
+    generate(gallery_with_one_photo, str(tmpdir))
+    imagesize.get.assert_called_once_with(str(large_path))
+
+
+def test_photo_metadata_cached(tmpdir, monkeypatch, gallery_with_one_photo,
+                               disable_resize):
+    """Metadata of photos should be read when they are resized and then
+    taken from the manifest."""
+    for size_name in generator.SIZES:
+        tmpdir.join("album", size_name, "photo.jpg").ensure()
+    generate(gallery_with_one_photo, str(tmpdir))
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.metadata.size == (2000, 1500)
+
+    read_mock = MagicMock()
+    monkeypatch.setattr(generator, 'read_metadata', read_mock)
+    generate(gallery_with_one_photo, str(tmpdir))
+    assert not read_mock.called
+    assert photo.metadata.size == (2000, 1500)
+
+
+def test_album_released(tmpdir, disable_resize):
+    """Photos of lazily loaded albums should be released after the album is
+    generated."""
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    loader = MagicMock(side_effect=lambda: [
+        Section("photos", [Photo("photo.jpg", "", "", photo_path)])])
+    album = Album("album", "The Album", date(2017, 6, 24), loader=loader)
+    generate(Gallery("Testing Gallery", "The Tester", [album]), str(tmpdir))
+
+    assert loader.call_count == 1
+    assert tmpdir.join("album", "index.html").exists()
+    assert album._sections is None
+
+
 def test_resized_images_metadata(tmpdir, gallery_with_one_photo):
     """Generator should fill resized images metadata in the Photo."""
     generate(gallery_with_one_photo, str(tmpdir))
@@ -96,6 +589,55 @@ def test_resized_images_metadata(tmpdir, gallery_with_one_photo):
     assert photo.large.size <= (1500, 1000)
 
 
+def test_fingerprinted_urls(tmpdir, gallery_with_one_photo, disable_resize):
+    """With fingerprinting, URLs should contain versions of the content."""
+    thumb = tmpdir.join("album", "thumb", "photo.jpg")
+    thumb.write("thumbnail", ensure=True)
+    tmpdir.join("album", "large", "photo.jpg").write("large", ensure=True)
+    config = BuildConfig(fingerprint=True)
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    version = file_hash(str(thumb))[:10]
+    assert photo.thumb.url == "thumb/photo.jpg?v=" + version
+    page = tmpdir.join("album", "index.html").read()
+    assert 'src="../assets/kaleidoscope.js?v=' in page
+
+    thumb.write("changed thumbnail")
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.thumb.url == "thumb/photo.jpg?v=" + file_hash(str(thumb))[:10]
+
+    generate(gallery_with_one_photo, str(tmpdir))
+    page = tmpdir.join("album", "index.html").read()
+    assert 'src="../assets/kaleidoscope.js"' in page
+
+
+def test_fingerprinted_format_urls(tmpdir, monkeypatch,
+                                   gallery_with_one_photo, disable_resize):
+    """URLs of images in additional formats should contain versions of
+    their own content."""
+    backend = generator.get_backend('convert')
+    monkeypatch.setattr(backend, 'supported_formats', lambda: {'webp'})
+    monkeypatch.setattr(generator, 'get_backend', lambda name: backend)
+    for size_name in generator.SIZES:
+        tmpdir.join("album", size_name, "photo.jpg").write("jpeg", ensure=True)
+    webp = tmpdir.join("album", "thumb", "photo.jpg.webp")
+    webp.write("webp")
+    tmpdir.join("album", "large", "photo.jpg.webp").write("webp")
+    config = BuildConfig(fingerprint=True, formats=('webp',))
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.thumb.sources == ((
+        'image/webp',
+        'thumb/photo.jpg.webp?v=' + file_hash(str(webp))[:10]),)
+
+    webp.write("changed webp")
+    generate(gallery_with_one_photo, str(tmpdir), config=config)
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    assert photo.thumb.sources[0][1] == \
+        'thumb/photo.jpg.webp?v=' + file_hash(str(webp))[:10]
+
+
 def test_copy_assets(tmpdir, disable_resize):
     """Generator should copy assets directory into output."""
     gallery = Gallery("", "", [])
@@ -112,6 +654,52 @@ def test_assets_directory_cleaned(tmpdir, disable_resize):
     assert not extra_file.exists()
 
 
+def test_assets_not_copied_again(tmpdir, disable_resize):
+    """Unchanged assets should not be copied again."""
+    generate(Gallery("", "", []), str(tmpdir))
+    asset = tmpdir.join("assets", "kaleidoscope.js")
+    asset.setmtime(1000000)
+    generate(Gallery("", "", []), str(tmpdir))
+    assert asset.mtime() == 1000000
+
+
+def test_unchanged_pages_not_rendered(tmpdir, monkeypatch,
+                                      gallery_with_one_photo, disable_resize):
+    """Pages should not be rendered again if their inputs did not change."""
+    generate(gallery_with_one_photo, str(tmpdir))
+    render_mock = MagicMock()
+    monkeypatch.setattr(renderer, 'render', render_mock)
+
+    generate(gallery_with_one_photo, str(tmpdir))
+    assert not render_mock.called
+
+    photo = next(gallery_with_one_photo.albums[0].photos)
+    photo.short_caption = "New caption"
+    generate(gallery_with_one_photo, str(tmpdir))
+    render_mock.assert_called_once_with(
+        "album.html", str(tmpdir.join("album", "index.html")), ANY)
+
+
+def test_deleted_page_rendered(tmpdir, gallery_with_one_photo, disable_resize):
+    """Missing page should be rendered even when its inputs did not
+    change."""
+    generate(gallery_with_one_photo, str(tmpdir))
+    tmpdir.join("album", "index.html").remove()
+    generate(gallery_with_one_photo, str(tmpdir))
+    assert tmpdir.join("album", "index.html").exists()
+
+
+def test_write_if_changed(tmpdir):
+    """Files with unchanged content should not be written."""
+    path = tmpdir.join("dir", "file.txt")
+    assert renderer.write_if_changed(str(path), "content")
+    path.setmtime(1000000)
+    assert not renderer.write_if_changed(str(path), "content")
+    assert path.mtime() == 1000000
+    assert renderer.write_if_changed(str(path), "changed")
+    assert path.read() == "changed"
+
+
 def test_generator_reporting_events(gallery_with_three_photos, tmpdir,
                                     disable_resize):
     """Generator should report important events using provided reporter."""
@@ -124,6 +712,22 @@ def test_generator_reporting_events(gallery_with_three_photos, tmpdir,
     assert listener.resizing_photo.call_count == 3
 
 
+def test_generator_reporting_timing(gallery_with_three_photos, tmpdir,
+                                    disable_resize):
+    """Generator should report durations of build stages."""
+    listener = MagicMock(spec=DefaultListener)
+    generate(gallery_with_three_photos, tmpdir, listener)
+
+    album = gallery_with_three_photos.albums[0]
+    stages = [(c[0][0], c[0][1])
+              for c in listener.stage_finished.call_args_list]
+    assert sorted(stages, key=str) == sorted([
+        ('assets', None), ('gallery_index', None), ('scan', album),
+        ('metadata', album), ('render', album), ('prune', None)], key=str)
+    assert listener.photo_resized.call_count == 3
+    assert listener.photo_resized.call_args[0][0] is album
+
+
 def test_counting_photos_to_resize(
         gallery_with_three_photos, tmpdir, disable_resize):
     """Listener should receive count of photos that would be really resized."""
@@ -139,6 +743,69 @@ def test_counting_photos_to_resize(
     assert listener.resizing_photo.call_count == 2
 
 
+def test_parallel_resize_album_events(tmpdir, disable_resize):
+    """With several jobs, every photo is resized and events of each album
+    are reported in order."""
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    albums = [
+        Album("album%d" % (a,), "Album", date(2017, 6, 24 - a), [Section(
+            "photos", [Photo("f%d.jpg" % (i,), "", "", photo_path)
+                       for i in range(5)])])
+        for a in range(3)
+    ]
+    gallery = Gallery("Testing Gallery", "The Tester", albums)
+    events = []
+    listener = MagicMock(spec=DefaultListener)
+    listener.starting_album.side_effect = \
+        lambda album, count: events.append(('start', album, count))
+    listener.resizing_photo.side_effect = \
+        lambda photo: events.append(('resize', photo))
+    listener.finishing_album.side_effect = \
+        lambda album: events.append(('finish', album))
+    generate(gallery, tmpdir, listener, BuildConfig(jobs=4))
+
+    assert generator.resize.call_count == 15
+
+    def index(*event):
+        return next(i for i, e in enumerate(events)
+                    if all(a is b for a, b in zip(e, event)))
+    for album in albums:
+        start = index('start', album)
+        finish = index('finish', album)
+        for photo in album.photos:
+            assert start < index('resize', photo) < finish
+
+
+def test_album_not_waiting_for_previous(tmpdir, monkeypatch, disable_resize):
+    """Album page should be generated as soon as its photos are resized,
+    without waiting for photos of previous albums."""
+    photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
+    slow = Album("slow", "Slow", date(2017, 6, 24), [Section(
+        "photos", [Photo("s%d.jpg" % (i,), "", "", photo_path)
+                   for i in range(2)])])
+    fast = Album("fast", "Fast", date(2017, 6, 23), [Section(
+        "photos", [Photo("f.jpg", "", "", photo_path)])])
+    gallery = Gallery("Testing Gallery", "The Tester", [slow, fast])
+    fast_finished = threading.Event()
+
+    def resize(photo, album_output, *args):
+        if photo.name.startswith('s'):
+            fast_finished.wait(timeout=5)
+        return {}
+    monkeypatch.setattr(generator, 'resize', resize)
+    finished = []
+
+    def finishing_album(album):
+        finished.append(album)
+        if album is fast:
+            fast_finished.set()
+    listener = MagicMock(spec=DefaultListener)
+    listener.finishing_album.side_effect = finishing_album
+    generate(gallery, tmpdir, listener, BuildConfig(jobs=3))
+
+    assert finished == [fast, slow]
+
+
 @pytest.fixture
 def gallery_with_one_photo():
     photo_path = os.path.join(os.path.dirname(__file__), 'data', 'photo.jpg')
@@ -158,5 +825,5 @@ def gallery_with_three_photos():
 @pytest.fixture
 def disable_resize(monkeypatch):
     """Replace image resize with dummy function and provide constant size."""
-    monkeypatch.setattr(generator, 'resize', MagicMock())
+    monkeypatch.setattr(generator, 'resize', MagicMock(return_value={}))
     monkeypatch.setattr(imagesize, 'get', MagicMock(return_value=(42, 42)))
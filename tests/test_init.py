@@ -1,4 +1,6 @@
+import os
 from pathlib import Path
+from unittest.mock import MagicMock
 
 from kaleidoscope import gallery
 from kaleidoscope.config import GalleryConfigParser
@@ -26,6 +28,53 @@ def test_init_album(testing_gallery):
     })
 
 
+def test_init_album_keeps_captions(testing_gallery):
+    """New photos should be appended to the existing configuration."""
+    album_path = testing_gallery.join('testing-album')
+    album_ini = album_path.join('album.ini')
+    original = album_ini.read()
+    album_path.join('Photo0.jpg').write("")
+    assert gallery.generate_album_ini(Path(album_path)) == 'updated'
+    assert album_ini.read() == original + "Photo0.jpg\n"
+    assert gallery.generate_album_ini(Path(album_path)) is None
+
+
+def test_init_album_photos_before_album_section(tmpdir):
+    """New photos should be added to the last photo section, also when the
+    album section follows it."""
+    tmpdir.join('a.jpg').write("")
+    tmpdir.join('b.jpg').write("")
+    album_ini = tmpdir.join('album.ini')
+    album_ini.write("[photos]\na.jpg: A\n\n[album]\ntitle: Album\n")
+    assert gallery.generate_album_ini(Path(tmpdir)) == 'updated'
+    assert album_ini.read() == \
+        "[photos]\na.jpg: A\nb.jpg\n\n[album]\ntitle: Album\n"
+    assert valid_configuration(album_ini, {'album': ['title'],
+                                           'photos': ['a.jpg', 'b.jpg']})
+
+
+def test_init_all_albums(testing_gallery, monkeypatch):
+    """All directories with photos should be initialized, unchanged
+    directories should be skipped by the next run."""
+    testing_gallery.join('testing-album', 'album.ini').remove()
+    testing_gallery.join('new-album', 'photo.JPG').ensure()
+    testing_gallery.join('empty').ensure(dir=True)
+    results = gallery.init_albums(str(testing_gallery))
+    assert sorted((os.path.basename(path), result)
+                  for path, result in results) == [
+        ('empty', None), ('incomplete-album', None),
+        ('new-album', 'generated'), ('testing-album', 'generated')]
+    assert not testing_gallery.join('empty', 'album.ini').exists()
+    assert valid_configuration(testing_gallery.join('new-album', 'album.ini'),
+                               {'photos': ['photo.JPG']})
+
+    find_mock = MagicMock(return_value=[])
+    monkeypatch.setattr(gallery, 'find_photos', find_mock)
+    testing_gallery.join('new-album', 'photo2.jpg').ensure()
+    gallery.init_albums(str(testing_gallery))
+    find_mock.assert_called_once_with(Path(testing_gallery.join('new-album')))
+
+
 def valid_configuration(path, sections):
     """
     Check if configuration file exists and has specified sections and
@@ -0,0 +1,171 @@
+import os
+from unittest.mock import patch
+
+from kaleidoscope.manifest import Manifest, MANIFEST_NAME, file_hash
+
+PARAMS = {
+    'thumb': {'geometry': [330, 220], 'backend': 'convert-1'},
+    'large': {'geometry': [1500, 1000], 'backend': 'convert-1'},
+}
+
+
+def test_unknown_photo_not_outdated(tmpdir):
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest.load(str(tmpdir))
+    assert "a/photo.jpg" not in manifest
+    assert not manifest.is_outdated("a/photo.jpg", str(source), PARAMS)
+
+
+def test_save_and_load(tmpdir):
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest.load(str(tmpdir))
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    manifest.save()
+    assert tmpdir.join(MANIFEST_NAME).exists()
+
+    loaded = Manifest.load(str(tmpdir))
+    assert "a/photo.jpg" in loaded
+    assert not loaded.is_outdated("a/photo.jpg", str(source), PARAMS)
+
+
+def test_changed_source_outdated(tmpdir):
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest(str(tmpdir.join(MANIFEST_NAME)))
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    source.write("new data")
+    assert manifest.is_outdated("a/photo.jpg", str(source), PARAMS)
+    assert manifest.outdated_sizes("a/photo.jpg", str(source), PARAMS) \
+        == {'thumb', 'large'}
+
+
+def test_changed_params_outdated(tmpdir):
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest(str(tmpdir.join(MANIFEST_NAME)))
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    params = dict(PARAMS, thumb={'geometry': [200, 200],
+                                 'backend': 'convert-1'})
+    assert manifest.is_outdated("a/photo.jpg", str(source), params)
+    assert manifest.outdated_sizes("a/photo.jpg", str(source), params) \
+        == {'thumb'}
+
+
+def test_touched_source_with_content_hash(tmpdir):
+    """With content hash, changed modification time alone does not make
+    the photo outdated."""
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest(str(tmpdir.join(MANIFEST_NAME)), content_hash=True)
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    stat = os.stat(str(source))
+    os.utime(str(source), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert not manifest.is_outdated("a/photo.jpg", str(source), PARAMS)
+    source.write("dat2")
+    assert manifest.is_outdated("a/photo.jpg", str(source), PARAMS)
+
+
+def test_resized_hash_recorded(tmpdir):
+    """Hash of unchanged resized image should not be computed again."""
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    resized = tmpdir.join("thumb", "photo.jpg")
+    resized.write("resized", ensure=True)
+    manifest = Manifest.load(str(tmpdir))
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    stat = os.stat(str(resized))
+    content_hash = manifest.resized_hash("a/photo.jpg", "thumb",
+                                         str(resized), stat)
+    assert content_hash == file_hash(str(resized))
+    manifest.record_resized("a/photo.jpg", "thumb", stat, (3, 2), content_hash)
+
+    with patch('kaleidoscope.manifest.file_hash') as hash_mock:
+        assert manifest.resized_hash("a/photo.jpg", "thumb", str(resized),
+                                     stat) == content_hash
+        assert not hash_mock.called
+
+
+def test_corrupted_manifest_ignored(tmpdir):
+    tmpdir.join(MANIFEST_NAME, "index.json").write("{not json", ensure=True)
+    manifest = Manifest.load(str(tmpdir))
+    assert "a/photo.jpg" not in manifest
+
+
+def test_shard_manifest_starts_from_main(tmpdir):
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest.load(str(tmpdir))
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    manifest.save()
+    shard = Manifest.load(str(tmpdir), name=MANIFEST_NAME + '.shard')
+    assert "a/photo.jpg" in shard
+    shard.record("b/photo.jpg", str(source), PARAMS)
+    shard.save()
+    assert tmpdir.join(MANIFEST_NAME + '.shard').exists()
+
+
+def test_merge(tmpdir):
+    """Records of albums owned by the other manifest should be replaced."""
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest.load(str(tmpdir))
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    manifest.record("b/photo.jpg", str(source), PARAMS)
+    shard = Manifest.load(str(tmpdir), name=MANIFEST_NAME + '.shard')
+    shard.record("b/other.jpg", str(source), PARAMS)
+    shard.record("c/photo.jpg", str(source), PARAMS)
+
+    manifest.merge(shard, lambda album: album in ('b', 'c'))
+    assert "a/photo.jpg" in manifest
+    assert "b/photo.jpg" not in manifest
+    assert "b/other.jpg" in manifest
+    assert "c/photo.jpg" in manifest
+
+
+def test_prune(tmpdir):
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest.load(str(tmpdir))
+    for key in ("a/photo.jpg", "a/removed.jpg", "b/photo.jpg"):
+        manifest.record(key, str(source), PARAMS)
+    manifest.record_page(str(tmpdir.join("index.html")), "key")
+    manifest.record_page(str(tmpdir.join("b", "index.html")), "key")
+
+    assert manifest.prune_albums({"a"}) == {"b"}
+    assert manifest.prune_photos({"a": {"photo.jpg"}}) == \
+        {"a": {"removed.jpg"}}
+    assert "a/photo.jpg" in manifest
+    assert "a/removed.jpg" not in manifest
+    assert "b/photo.jpg" not in manifest
+    tmpdir.join("index.html").write("")
+    assert manifest.is_page_current(str(tmpdir.join("index.html")), "key")
+
+
+def test_save_writes_changed_albums(tmpdir):
+    """Only records of albums changed since the last save should be
+    written."""
+    source = tmpdir.join("photo.jpg")
+    source.write("data")
+    manifest = Manifest.load(str(tmpdir))
+    manifest.record("a/photo.jpg", str(source), PARAMS)
+    manifest.record("b/photo.jpg", str(source), PARAMS)
+    manifest.record_page(str(tmpdir.join("b", "index.html")), "key")
+    manifest.save()
+    albums = tmpdir.join(MANIFEST_NAME, "albums")
+    inodes = {name: albums.join(name).stat().ino
+              for name in ("a.json", "b.json")}
+
+    manifest.record("a/other.jpg", str(source), PARAMS)
+    manifest.save()
+    assert albums.join("a.json").stat().ino != inodes["a.json"]
+    assert albums.join("b.json").stat().ino == inodes["b.json"]
+
+    manifest.prune_albums({"a"})
+    manifest.save()
+    assert not albums.join("b.json").exists()
+    loaded = Manifest.load(str(tmpdir))
+    assert "a/photo.jpg" in loaded
+    assert "a/other.jpg" in loaded
+    assert "b/photo.jpg" not in loaded
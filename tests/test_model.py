@@ -29,3 +29,32 @@ def test_default_album_section():
 def test_non_default_album_section():
     section = model.Section(name="My Section", photos=[])
     assert section.is_default() is False
+
+
+def test_album_lazy_sections():
+    """Album sections should be loaded on first access and can be
+    released."""
+    sections = [model.Section(name="photos", photos=[])]
+    calls = []
+    album = model.Album("a", "A", date(2020, 1, 1),
+                        loader=lambda: calls.append(1) or sections)
+    assert calls == []
+    assert album.sections == sections
+    assert album.sections == sections
+    assert calls == [1]
+    album.release()
+    assert album.sections == sections
+    assert calls == [1, 1]
+
+
+def test_album_without_loader_not_released():
+    sections = [model.Section(name="photos", photos=[])]
+    album = model.Album("a", "A", date(2020, 1, 1), sections)
+    album.release()
+    assert album.sections is sections
+
+
+def test_photo_equality():
+    photo = model.Photo("a.jpg", "A", "A long", "src/a.jpg")
+    assert photo == model.Photo("a.jpg", "A", "A long", "src/a.jpg")
+    assert photo != model.Photo("b.jpg", "A", "A long", "src/b.jpg")
@@ -0,0 +1,40 @@
+import json
+from datetime import date
+
+from kaleidoscope.model import Album, Photo
+from kaleidoscope.profiler import Profiler
+
+
+def test_stage_totals():
+    album = Album("album", "Album", date(2020, 1, 1), [])
+    profiler = Profiler()
+    profiler.stage_finished('assets', None, 1.0, 0.5)
+    profiler.stage_finished('render', album, 2.0, 1.5)
+    profiler.stage_finished('render', album, 3.0, 2.5)
+    report = profiler.report()
+    assert report['stages']['assets'] == {'wall': 1.0, 'cpu': 0.5, 'count': 1}
+    assert report['stages']['render'] == {'wall': 5.0, 'cpu': 4.0, 'count': 2}
+    assert report['albums'] == {
+        'album': {'render': {'wall': 5.0, 'cpu': 4.0, 'count': 2}}
+    }
+
+
+def test_slowest_photos():
+    album = Album("album", "Album", date(2020, 1, 1), [])
+    profiler = Profiler(slowest_photos=2)
+    for i, duration in enumerate([3.0, 1.0, 5.0, 2.0]):
+        photo = Photo("p%d.jpg" % (i,), "", "", "src/p%d.jpg" % (i,))
+        profiler.photo_resized(album, photo, duration, 0.0)
+    report = profiler.report()
+    assert [p['photo'] for p in report['slowest_photos']] == \
+        ['p2.jpg', 'p0.jpg']
+    assert report['stages']['resize']['count'] == 4
+    assert report['albums']['album']['resize']['wall'] == 11.0
+
+
+def test_write(tmpdir):
+    profiler = Profiler()
+    profiler.stage_finished('assets', None, 1.0, 0.5)
+    path = tmpdir.join('profile.json')
+    profiler.write(str(path))
+    assert json.loads(path.read())['stages']['assets']['count'] == 1
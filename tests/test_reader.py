@@ -1,7 +1,11 @@
 import os
 from datetime import date
+from unittest.mock import ANY, MagicMock
+
+import pytest
 
 from kaleidoscope import reader
+from kaleidoscope.config import BuildConfig
 
 
 def test_read_gallery(testing_gallery):
@@ -19,6 +23,38 @@ def test_skipping_nonalbum_dirs(testing_gallery):
     assert len(gallery.albums) == 2
 
 
+def test_read_gallery_cached(testing_gallery, monkeypatch):
+    """Albums which did not change should be read from the cache."""
+    cache_path = str(testing_gallery.join('output', 'albums.json'))
+    gallery = reader.read_gallery(str(testing_gallery),
+                                  reader.AlbumCache.load(cache_path))
+
+    read_mock = MagicMock(side_effect=reader._read_album)
+    monkeypatch.setattr(reader, '_read_album', read_mock)
+    cached = reader.read_gallery(str(testing_gallery),
+                                 reader.AlbumCache.load(cache_path))
+    assert not read_mock.called
+    assert cached.albums == gallery.albums
+
+    album_ini = testing_gallery.join('testing-album', 'album.ini')
+    album_ini.write(album_ini.read().replace("Testing Album", "Changed"))
+    changed = reader.read_gallery(str(testing_gallery),
+                                  reader.AlbumCache.load(cache_path))
+    read_mock.assert_called_once_with(
+        str(testing_gallery.join('testing-album')), ANY)
+    assert [a.title for a in changed.albums if a.name == 'testing-album'] \
+        == ['Changed']
+
+
+def test_read_gallery_lazy(testing_gallery):
+    """Albums sections should be loaded only when accessed."""
+    gallery = reader.read_gallery(str(testing_gallery))
+    album = next(a for a in gallery.albums if a.name == 'testing-album')
+    assert album._sections is None
+    assert [p.name for p in album.photos] == \
+        ['Photo1.jpg', 'Photo2.jpg', 'Photo3.jpg', 'Photo4.jpg']
+
+
 def test_read_album(testing_gallery):
     album_dir = str(testing_gallery.join("testing-album"))
     album = reader.read_album(album_dir)
@@ -55,3 +91,45 @@ def test_read_photos(testing_gallery):
         assert photo.short_caption == short_caption
         assert photo.long_caption == long_caption
         assert photo.source_path == os.path.join(album_dir, name)
+
+
+def test_read_default_build_config(testing_gallery):
+    """Without [build] section, default settings are used."""
+    assert reader.read_build_config(str(testing_gallery)) == BuildConfig()
+
+
+def test_read_build_config(testing_gallery):
+    testing_gallery.join('gallery.ini').write(
+        "[build]\njobs: 3\nresize-backend: pillow\n", mode='a')
+    config = reader.read_build_config(str(testing_gallery))
+    assert config.jobs == 3
+    assert config.resize_backend == 'pillow'
+
+
+def test_read_build_config_formats(testing_gallery):
+    testing_gallery.join('gallery.ini').write(
+        "[build]\nformats: WebP, avif\n", mode='a')
+    config = reader.read_build_config(str(testing_gallery))
+    assert config.formats == ('webp', 'avif')
+
+
+def test_read_build_config_unknown_format(testing_gallery):
+    testing_gallery.join('gallery.ini').write(
+        "[build]\nformats: webp gif\n", mode='a')
+    with pytest.raises(ValueError):
+        reader.read_build_config(str(testing_gallery))
+
+
+def test_read_build_config_sizes(testing_gallery):
+    testing_gallery.join('gallery.ini').write(
+        "[build]\nlarge-sizes: 1000x667 2400X1600\n", mode='a')
+    config = reader.read_build_config(str(testing_gallery))
+    assert config.large_sizes == ((1000, 667), (2400, 1600))
+    assert config.thumb_sizes == BuildConfig().thumb_sizes
+
+
+def test_read_build_config_invalid_sizes(testing_gallery):
+    testing_gallery.join('gallery.ini').write(
+        "[build]\nthumb-sizes: 330x220 330x300\n", mode='a')
+    with pytest.raises(ValueError):
+        reader.read_build_config(str(testing_gallery))
@@ -0,0 +1,18 @@
+import pytest
+
+from kaleidoscope.manifest import MANIFEST_NAME
+from kaleidoscope.shard import Shard, shard_manifests
+
+
+def test_parse_shard():
+    assert Shard.parse("2/4") == Shard(2, 4)
+    with pytest.raises(ValueError):
+        Shard.parse("5/4")
+
+
+def test_shard_manifests(tmpdir):
+    tmpdir.join(MANIFEST_NAME).write("{}")
+    tmpdir.join(Shard(2, 3).manifest_name).write("{}")
+    tmpdir.join(MANIFEST_NAME + ".shard-x").write("{}")
+    assert list(shard_manifests(str(tmpdir))) == \
+        [(Shard(2, 3).manifest_name, Shard(2, 3))]
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+from kaleidoscope.staging import staged_output
+
+
+def test_staged_output_replaces_output(tmpdir):
+    output = tmpdir.join("output")
+    output.ensure("page.html").write("old")
+    with staged_output(str(output)) as staging:
+        assert os.path.samefile(os.path.join(staging, "page.html"),
+                                str(output.join("page.html")))
+        os.remove(os.path.join(staging, "page.html"))
+        with open(os.path.join(staging, "page.html"), "w") as f:
+            f.write("new")
+        assert output.join("page.html").read() == "old"
+    assert output.islink()
+    assert output.join("page.html").read() == "new"
+
+
+def test_failed_build_keeps_output(tmpdir):
+    output = tmpdir.join("output")
+    output.ensure("page.html").write("old")
+    with pytest.raises(RuntimeError):
+        with staged_output(str(output)) as staging:
+            os.remove(os.path.join(staging, "page.html"))
+            raise RuntimeError
+    assert output.join("page.html").read() == "old"
@@ -0,0 +1,58 @@
+import os
+
+from kaleidoscope.store import DerivativeStore
+
+PARAMS = {'thumb': {'geometry': [330, 220], 'backend': 'test-1'}}
+
+
+def _source(tmpdir, content="data"):
+    source = tmpdir.join("photo.jpg")
+    source.write(content)
+    return str(source)
+
+
+def test_key_depends_on_content_and_params(tmpdir):
+    source = _source(tmpdir)
+    store = DerivativeStore(str(tmpdir.join("store")), PARAMS)
+    key = store.key(source)
+    assert DerivativeStore(str(tmpdir.join("other")), PARAMS).key(source) \
+        == key
+    assert DerivativeStore(str(tmpdir), PARAMS, ('webp',)).key(source) != key
+    _source(tmpdir, "changed")
+    assert store.key(source) != key
+
+
+def test_entry_created_once(tmpdir):
+    store = DerivativeStore(str(tmpdir.join("store")), PARAMS)
+    key = store.key(_source(tmpdir))
+    created = []
+
+    def create(path):
+        created.append(path)
+        with open(os.path.join(path, "image.jpg"), 'w') as f:
+            f.write("resized")
+        return 'result'
+
+    path, result = store.get(key, create)
+    assert result == 'result'
+    assert os.path.isfile(os.path.join(path, "image.jpg"))
+    assert store.get(key, create) == (path, None)
+    assert len(created) == 1
+    assert os.listdir(os.path.dirname(path)) == [os.path.basename(path)]
+
+
+def test_unlinked_entries_collected(tmpdir):
+    store = DerivativeStore(str(tmpdir.join("store")), PARAMS)
+    path, _ = store.get(store.key(_source(tmpdir)), lambda path: None)
+    stored = os.path.join(path, "image.jpg")
+    with open(stored, 'w') as f:
+        f.write("resized")
+    target = tmpdir.join("album", "thumb", "photo.jpg")
+    store.link(stored, str(target))
+    assert store.modified
+    store.collect()
+    assert os.path.exists(stored)
+
+    target.remove()
+    store.collect()
+    assert not os.path.exists(path)
@@ -0,0 +1,65 @@
+import os
+
+from kaleidoscope import reader
+from kaleidoscope.watcher import GalleryWatcher
+
+
+def test_no_changes(testing_gallery):
+    watcher = GalleryWatcher(str(testing_gallery))
+    gallery = reader.read_gallery(str(testing_gallery))
+    assert watcher.update(gallery) is None
+
+
+def test_changed_album(testing_gallery):
+    """Only the changed album should be read again."""
+    watcher = GalleryWatcher(str(testing_gallery))
+    gallery = reader.read_gallery(str(testing_gallery))
+    unchanged = next(a for a in gallery.albums if a.name == 'incomplete-album')
+
+    album_ini = testing_gallery.join('testing-album', 'album.ini')
+    album_ini.write(album_ini.read().replace("Testing Album", "Renamed"))
+    _touch_later(album_ini)
+    gallery, changed = watcher.update(gallery)
+
+    assert [a.name for a in changed] == ['testing-album']
+    assert changed[0].title == "Renamed"
+    assert changed[0] in gallery.albums
+    assert unchanged in gallery.albums
+    assert len(gallery.albums) == 2
+
+
+def test_new_album(testing_gallery):
+    watcher = GalleryWatcher(str(testing_gallery))
+    gallery = reader.read_gallery(str(testing_gallery))
+    testing_gallery.join('new-album', 'album.ini').write(
+        "[album]\ntitle: New\ndate: 2020-01-01\n", ensure=True)
+    gallery, changed = watcher.update(gallery)
+    assert [a.name for a in changed] == ['new-album']
+    assert len(gallery.albums) == 3
+
+
+def test_removed_album(testing_gallery):
+    watcher = GalleryWatcher(str(testing_gallery))
+    gallery = reader.read_gallery(str(testing_gallery))
+    testing_gallery.join('testing-album').remove()
+    gallery, changed = watcher.update(gallery)
+    assert changed == []
+    assert [a.name for a in gallery.albums] == ['incomplete-album']
+
+
+def test_changed_gallery_config(testing_gallery):
+    """Change of gallery config should cause reading the whole gallery."""
+    watcher = GalleryWatcher(str(testing_gallery))
+    gallery = reader.read_gallery(str(testing_gallery))
+    gallery_ini = testing_gallery.join('gallery.ini')
+    gallery_ini.write("[gallery]\ntitle: New title\nauthor: Me\n")
+    _touch_later(gallery_ini)
+    gallery, changed = watcher.update(gallery)
+    assert gallery.title == "New title"
+    assert len(changed) == 2
+
+
+def _touch_later(path):
+    """Make sure modification time changes even on coarse file systems."""
+    stat = os.stat(str(path))
+    os.utime(str(path), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))